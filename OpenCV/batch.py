@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# Offline analysis of recordings on every core.
+#
+# Each file is split into ranges starting on keyframes, so a worker seeks
+# straight to its range and decodes nothing twice. Ranges run on a process
+# pool and their results are merged back in order, one JSON line per frame.
+#
+# usage: python batch.py [--task=detect] [--workers=N] [--range=60] [--out=results.jsonl] <dir | glob | files...>
+#
+# Tasks:
+#   detect  moving blob boxes of detector.MotionDetector; the background
+#           model is learnt per range, the first frames of each find nothing
+#   gray    mean brightness, the cvtColor of Opencv-read.py
+
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+import keyframes
+
+EXTENSIONS = ('.mp4', '.mkv', '.avi', '.mov', '.ts')
+
+
+def split(keyframe_pts, target=60.0):
+    """Cut a file into ranges of about target seconds starting on keyframes
+
+    Args:
+        keyframe_pts (list): Sorted keyframe pts in ns, see keyframes.scan()
+        target (float, optional): Range length in seconds
+
+    Returns:
+        list: (start, end) pts in ns, end is None for the last range
+    """
+    starts = []
+    for pts in keyframe_pts:
+        if not starts or pts - starts[-1] >= target * 1e9:
+            starts.append(pts)
+    if not starts:
+        return [(0, None)]
+    starts[0] = min(starts[0], 0)
+    return list(zip(starts, starts[1:] + [None]))
+
+
+def frames(path, start, end):
+    """Decode the frames with start <= pts < end
+
+    Yields:
+        tuple: (pts in ns, BGR frame)
+    """
+    cap = cv2.VideoCapture(path)
+    try:
+        if start > 0:
+            cap.set(cv2.CAP_PROP_POS_MSEC, start / 1e6)
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            pts = int(cap.get(cv2.CAP_PROP_POS_MSEC) * 1e6)
+            if pts < start:
+                continue
+            if end is not None and pts >= end:
+                break
+            yield pts, frame
+    finally:
+        cap.release()
+
+
+def detect_range(path, start, end):
+    from detector import MotionDetector
+    detector = MotionDetector()
+    return [{'pts': pts, 'boxes': detector.detect(frame).tolist()}
+            for pts, frame in frames(path, start, end)]
+
+
+def gray_range(path, start, end):
+    return [{'pts': pts, 'mean': float(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY).mean())}
+            for pts, frame in frames(path, start, end)]
+
+
+TASKS = {
+    'detect': detect_range,
+    'gray': gray_range,
+}
+
+
+def expand(args):
+    """Video files named by directories, globs and paths, sorted"""
+    paths = []
+    for arg in args:
+        if os.path.isdir(arg):
+            paths += [os.path.join(arg, name) for name in os.listdir(arg)
+                      if name.lower().endswith(EXTENSIONS)]
+        else:
+            paths += glob.glob(arg) or [arg]
+    return sorted(set(paths))
+
+
+def run(paths, task='detect', workers=None, target=60.0):
+    """Process files range by range on a process pool
+
+    Ranges of all files are queued at once so the pool stays busy across
+    file boundaries; results are still yielded file by file, range by range.
+
+    Args:
+        paths (list): Video files
+        task (string, optional): Key of TASKS
+        workers (int, optional): Processes, defaults to the number of cores
+        target (float, optional): Range length in seconds
+
+    Yields:
+        tuple: (path, per-frame result dict)
+    """
+    fn = TASKS[task]
+    with ProcessPoolExecutor(workers) as pool:
+        # scanning only parses the container, it runs on the pool as well
+        scans = [(path, pool.submit(keyframes.scan, path)) for path in paths]
+        jobs = []
+        for path, scanned in scans:
+            ranges = split(scanned.result()[0], target)
+            jobs.append((path, [pool.submit(fn, path, start, end) for start, end in ranges]))
+        for path, futures in jobs:
+            for future in futures:
+                for result in future.result():
+                    yield path, result
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    task, workers, target, out = 'detect', None, 60.0, None
+    while args and args[0].startswith('--'):
+        flag, _, value = args.pop(0).partition('=')
+        if flag == '--task':
+            task = value
+        elif flag == '--workers':
+            workers = int(value)
+        elif flag == '--range':
+            target = float(value)
+        elif flag == '--out':
+            out = value
+        else:
+            sys.exit('unknown option ' + flag)
+    if task not in TASKS:
+        sys.exit('unknown task {}, one of {}'.format(task, ', '.join(TASKS)))
+    paths = expand(args)
+    if not paths:
+        sys.exit('no video files')
+
+    f = open(out, 'w') if out else sys.stdout
+    count = 0
+    start = time.monotonic()
+    try:
+        for path, result in run(paths, task, workers, target):
+            f.write(json.dumps(dict(result, file=path)) + '\n')
+            count += 1
+    finally:
+        if out:
+            f.close()
+    elapsed = time.monotonic() - start
+    print('{} frames of {} files in {:.1f} s ({:.0f} frames/s)'.format(
+        count, len(paths), elapsed, count / max(elapsed, 1e-9)), file=sys.stderr)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# Per-frame conversion cost of each capture format on videotestsrc (NV12,
+# like the camera). process_time() covers the videoconvert in the streaming
+# thread plus the Python side; 'BGR + cvtColor' is the old double
+# conversion done in test1.py for display.
+#
+# usage: python bench-formats.py [num-frames]
+
+import sys
+import time
+
+import cv2
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+import pipelines
+from vid import MappedFrame
+
+Gst.init(None)
+
+
+def use_packed(frame):
+    return int(frame[0, 0].sum())
+
+
+def use_planes(planes):
+    return sum(int(plane[0, 0]) for plane in planes)
+
+
+def use_bgr_cvtcolor(frame):
+    return int(cv2.cvtColor(frame, cv2.COLOR_RGB2RGBA)[0, 0].sum())
+
+
+CASES = [
+    ('BGR', 'BGR', use_packed),
+    ('BGR + cvtColor', 'BGR', use_bgr_cvtcolor),
+    ('BGRx view', 'BGRx', use_packed),
+    ('GRAY8', 'GRAY8', use_packed),
+    ('I420 planes', 'I420', use_planes),
+]
+
+
+def bench(format, use, count, width=1280, height=720):
+    config = pipelines.testsrc(width=width, height=height, format=format)
+    config[0] = config[0].replace('is-live=true', 'num-buffers={}'.format(count))
+    config[-1] = '! appsink name=sink sync=false max-buffers=2'
+    pipeline = Gst.parse_launch(' '.join(config))
+    sink = pipeline.get_by_name('sink')
+    cpu = time.process_time()
+    pipeline.set_state(Gst.State.PLAYING)
+    frames = 0
+    while True:
+        sample = sink.try_pull_sample(5 * Gst.SECOND)
+        if sample is None:
+            break
+        with MappedFrame(sample) as frame:
+            use(frame)
+        frames += 1
+    cpu = time.process_time() - cpu
+    pipeline.set_state(Gst.State.NULL)
+    return frames, cpu / max(frames, 1) * 1e3
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    print('{:16} {:>7} {:>14}'.format('path', 'frames', 'cpu ms/frame'))
+    for name, format, use in CASES:
+        frames, cpu = bench(format, use, count)
+        print('{:16} {:7d} {:14.2f}'.format(name, frames, cpu))
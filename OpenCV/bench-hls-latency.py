@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# Capture-to-client delivery time of plain and low latency HLS, and the
+# latency a player would add on top of it. Nothing is decoded or shown, so
+# this is not a glass-to-glass measurement: for that, compare the
+# clockoverlay timestamp in a real player with a wall clock (see hls.py).
+#
+# A live videotestsrc is packaged and served locally, and a client follows
+# the playlist the way a player does: plain HLS by polling for new
+# segments, LL-HLS by blocking reloads and preload hinted parts.
+#
+#   delivery   median time from the first frame of a download reaching the
+#              encoder to the download being on the client (measured)
+#   hold back  how far behind the live edge a player stays: PART-HOLD-BACK,
+#              or 3 target durations for plain HLS (from the playlist)
+#   estimate   delivery + hold back, leaving out decode and display
+#
+# usage: python bench-hls-latency.py [seconds-per-mode]
+
+import asyncio
+import re
+import statistics
+import sys
+import threading
+import time
+import urllib.request
+
+import hls
+
+PORT = 18080
+
+
+def videotest(framerate=30):
+    return [
+        'videotestsrc is-live=true',
+        '! video/x-raw, width=1280, height=720, framerate={}/1'.format(framerate),
+    ]
+
+
+def fetch(path):
+    with urllib.request.urlopen('http://127.0.0.1:{}/{}'.format(PORT, path), timeout=10) as response:
+        return response.read()
+
+
+def follow_plain(ring, seconds):
+    latencies = []
+    seen = -1
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        playlist = fetch(hls.PLAYLIST_NAME).decode()
+        for seq in map(int, re.findall(r'segment_(\d+)\.ts', playlist)):
+            if seq > seen:
+                fetch(hls.SEGMENT_NAME % seq)
+                captured = ring.get(seq).parts[0].captured
+                if seen >= 0 and captured is not None:
+                    latencies.append(time.time() - captured)
+                seen = seq
+        time.sleep(ring.target_duration / 2)
+    return latencies, 3 * ring.target_duration
+
+
+def follow_low_latency(ring, seconds):
+    latencies = []
+    playlist = fetch(hls.PLAYLIST_NAME).decode()
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        seq, index = map(int, re.search(r'PRELOAD-HINT:TYPE=PART,URI="part_(\d+)\.(\d+)\.ts"', playlist).groups())
+        # the hinted part blocks until the packager has it
+        fetch(hls.PART_NAME % (seq, index))
+        part = ring.get_part(seq, index)
+        if part is not None and part.captured is not None:
+            latencies.append(time.time() - part.captured)
+        playlist = fetch('{}?_HLS_msn={}&_HLS_part={}'.format(hls.PLAYLIST_NAME, seq, index)).decode()
+    hold_back = float(re.search(r'PART-HOLD-BACK=([\d.]+)', playlist).group(1))
+    return latencies, hold_back
+
+
+def run(name, ring, encode, follow, seconds):
+    packager = hls.HlsPackager(videotest() + encode + hls.ts_sink(), ring)
+    server = hls.HlsServer(ring, host='127.0.0.1', port=PORT)
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(server.serve())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    packager.start()
+    try:
+        # let the first segments fill the playlist
+        time.sleep(2 * ring.target_duration + 1)
+        latencies, hold_back = follow(ring, seconds)
+    finally:
+        packager.stop()
+        loop.call_soon_threadsafe(task.cancel)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+    if packager.captured_misses:
+        print('{:12} {} parts without a capture time left out'.format(name, packager.captured_misses))
+    if not latencies:
+        print('{:12} no downloads'.format(name))
+        return
+    delivery = statistics.median(latencies)
+    print('{:12} {:6d} {:>14.3f} {:>12.3f} {:>16.3f}'.format(
+        name, len(latencies), delivery, hold_back, delivery + hold_back))
+
+
+if __name__ == '__main__':
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 20
+    print('{:12} {:>6} {:>14} {:>12} {:>16}'.format(
+        'mode', 'n', 'delivery s', 'hold back s', 'estimate s'))
+    run('plain', hls.SegmentRing(target_duration=5.0, playlist_length=5, size=8),
+        hls.encoder(), follow_plain, seconds)
+    PORT += 1
+    ring, encode = hls.low_latency()
+    run('low latency', ring, encode, follow_low_latency, seconds)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# CPU cost per delivered frame with and without the in-pipeline
+# decimation/crop/scale stage of pipelines.py, on videotestsrc.
+# process_time() includes the GStreamer streaming threads, so the numbers
+# cover conversion and transfer as well as the Python side.
+#
+# usage: python bench-roi.py [seconds-per-case]
+
+import sys
+import time
+
+import pipelines
+from vid import Video
+
+CASES = [
+    ('full frame', {}),
+    ('rate 5', {'rate': 5}),
+    ('lane crop', {'crop': [0, 360, 0, 0]}),
+    ('crop + scale', {'crop': [0, 360, 0, 0], 'scale': [640, 180]}),
+    ('rate + crop + scale', {'rate': 5, 'crop': [0, 360, 0, 0], 'scale': [640, 180]}),
+]
+
+
+def bench(seconds, options):
+    video = Video(config=pipelines.testsrc(width=1280, height=720, framerate=30, **options))
+    # let the pipeline settle before measuring
+    video.read(timeout=5)
+    frames = 0
+    wall, cpu = time.monotonic(), time.process_time()
+    while time.monotonic() - wall < seconds:
+        frame = video.read(timeout=1)
+        if frame is not None:
+            frames += 1
+    cpu = time.process_time() - cpu
+    video.stop()
+    return frames, cpu / max(frames, 1) * 1e3
+
+
+if __name__ == '__main__':
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print('{:22} {:>7} {:>14}'.format('case', 'frames', 'cpu ms/frame'))
+    for name, options in CASES:
+        frames, cpu = bench(seconds, options)
+        print('{:22} {:7d} {:14.2f}'.format(name, frames, cpu))
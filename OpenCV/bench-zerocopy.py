@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# Compare the appsink -> numpy frame paths of vid.Video on videotestsrc:
+#   copy: extract_dup + np.ndarray (old behaviour)
+#   map:  read-only view of the mapped buffer
+#   pool: map + copy into a recycled array
+#
+# usage: python bench-zerocopy.py [num-frames]
+
+import sys
+import time
+
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+from vid import FramePool, MappedFrame, Video
+
+Gst.init(None)
+
+SIZES = [('720p', 1280, 720), ('1080p', 1920, 1080), ('4K', 3840, 2160)]
+
+
+def consume(frame):
+    # touch one pixel per row so the frame memory is really read
+    return int(frame[:, 0, 0].sum())
+
+
+def convert_copy(sample, pool):
+    consume(Video.gst_to_opencv(sample))
+
+
+def convert_map(sample, pool):
+    with MappedFrame(sample) as frame:
+        consume(frame)
+
+
+def convert_pool(sample, pool):
+    frame = Video.gst_to_pool(sample, pool)
+    consume(frame)
+    pool.release(frame)
+
+
+def bench(width, height, count, convert):
+    """Time only the conversion step, pulling samples is the same for all modes"""
+    pipeline = Gst.parse_launch(
+        'videotestsrc num-buffers={} ! video/x-raw,format=BGR,width={},height={} '
+        '! appsink name=sink sync=false max-buffers=2'.format(count, width, height))
+    sink = pipeline.get_by_name('sink')
+    pool = FramePool()
+    pipeline.set_state(Gst.State.PLAYING)
+    frames = wall = cpu = 0
+    while True:
+        sample = sink.try_pull_sample(5 * Gst.SECOND)
+        if sample is None:
+            break
+        t0, c0 = time.perf_counter(), time.process_time()
+        convert(sample, pool)
+        wall += time.perf_counter() - t0
+        cpu += time.process_time() - c0
+        frames += 1
+    pipeline.set_state(Gst.State.NULL)
+    return wall / frames * 1e6, cpu / frames * 1e6
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print('{:6} {:5} {:>12} {:>12}'.format('size', 'mode', 'us/frame', 'cpu us/frame'))
+    for name, width, height in SIZES:
+        for mode, convert in (('copy', convert_copy), ('map', convert_map), ('pool', convert_pool)):
+            wall, cpu = bench(width, height, count, convert)
+            print('{:6} {:5} {:12.1f} {:12.1f}'.format(name, mode, wall, cpu))
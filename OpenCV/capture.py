@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# Run several cameras in one process and read them through one loop.
+#
+# usage: python capture.py [--metrics=PORT] [num-test-cameras | cameras.json | video files...]
+
+import sys
+import threading
+import time
+
+import metrics
+import pipelines
+from vid import Video
+
+
+class CaptureManager():
+    """Runs N appsink pipelines and fans their frames in
+
+    Every camera is a vid.Video with its own bounded queue. All of them share
+    one condition so read() can wait on any camera without polling.
+
+    Attributes:
+        cameras (dict): Camera id to Video
+    """
+
+    def __init__(self, configs, mode='copy', queue_size=4):
+        """Summary
+
+        Args:
+            configs (dict): Camera id to pipeline description list, see pipelines.py
+            mode (string, optional): Frame delivery mode, see Video
+            queue_size (int, optional): Ring buffer size per camera
+        """
+        self._cond = threading.Condition()
+        self._order = list(configs)
+        self._next = 0
+        self._last_stats = {}
+        self.cameras = {}
+        for camera_id, config in configs.items():
+            self.cameras[camera_id] = Video(
+                mode=mode, queue_size=queue_size, config=config, cond=self._cond)
+
+    @property
+    def stopped(self):
+        return all(video.stopped for video in self.cameras.values())
+
+    def _ready(self):
+        return (any(video.pending() for video in self.cameras.values())
+                or all(video.stopped for video in self.cameras.values()))
+
+    def read(self, timeout=None):
+        """Wait for the next frame of any camera
+
+        Cameras are served round robin so a fast one can't starve the others.
+
+        Args:
+            timeout (float, optional): Seconds to wait, None waits forever
+
+        Returns:
+            tuple: (camera_id, Frame), None on timeout or once all cameras ended
+        """
+        with self._cond:
+            if not self._cond.wait_for(self._ready, timeout):
+                return None
+            for i in range(len(self._order)):
+                camera_id = self._order[(self._next + i) % len(self._order)]
+                video = self.cameras[camera_id]
+                if video.pending():
+                    self._next = (self._next + i + 1) % len(self._order)
+                    return camera_id, video.pop()
+        return None
+
+    def __iter__(self):
+        """Iterate over frames of all cameras until every one has ended
+
+        Yields:
+            tuple: (camera_id, pts, frame)
+        """
+        while True:
+            item = self.read()
+            if item is None:
+                return
+            camera_id, frame = item
+            yield camera_id, frame.pts, frame.data
+
+    def release(self, camera_id, frame):
+        """Give a frame back to its camera's pool, see Video.release()
+        """
+        self.cameras[camera_id].release(frame)
+
+    def stats(self):
+        """Per camera counters since the previous call
+
+        Returns:
+            dict: Camera id to {'frames', 'dropped', 'fps'}
+        """
+        now = time.monotonic()
+        result = {}
+        for camera_id, video in self.cameras.items():
+            frames, dropped = video.frames, video.dropped
+            last_time, last_frames = self._last_stats.get(camera_id, (None, 0))
+            fps = (frames - last_frames) / (now - last_time) if last_time else 0.0
+            self._last_stats[camera_id] = (now, frames)
+            result[camera_id] = {'frames': frames, 'dropped': dropped, 'fps': fps}
+        return result
+
+    def stop(self):
+        for video in self.cameras.values():
+            video.stop()
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    port = None
+    if args and args[0].startswith('--metrics='):
+        port = int(args.pop(0).split('=', 1)[1])
+    args = args or ['4']
+    if args[0].isdigit():
+        configs = {'cam%d' % i: pipelines.testsrc(pattern=i) for i in range(int(args[0]))}
+    elif args[0].endswith('.json'):
+        configs = pipelines.load(args[0])
+    else:
+        configs = {path: pipelines.filesrc(path) for path in args}
+
+    manager = CaptureManager(configs)
+    if port:
+        registry = metrics.Registry()
+        metrics.watch_manager(registry, manager)
+        metrics.MetricsServer(registry, port).start()
+    next_report = time.monotonic() + 1
+    try:
+        for camera_id, pts, frame in manager:
+            if time.monotonic() >= next_report:
+                next_report += 1
+                for name, stats in manager.stats().items():
+                    print('{}: {fps:5.1f} fps, {frames} frames, {dropped} dropped'.format(name, **stats))
+    except KeyboardInterrupt:
+        pass
+
+    manager.stop()
@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# Vehicle counts per lane from virtual lines, fed by detector.detections().
+#
+# Tracks are matched to detections by IoU, then by centroid distance for
+# small or fast blobs whose boxes no longer overlap. Every step works on
+# NumPy matrices of all tracks x all detections (or lines), so a frame
+# costs a handful of array operations however many vehicles are in it.
+#
+# usage: python counter.py [--lines=lines.json] [--interval=60] [num-test-cameras | cameras.json | video files...]
+#   lines.json maps camera ids to lanes and their line in frame pixels, e.g.
+#   {"north": {"lane1": [0, 500, 640, 500], "lane2": [640, 500, 1280, 500]}}
+
+import collections
+import json
+import sys
+import time
+
+import numpy as np
+
+# track_id: id of the crossing track, lane: line name, direction: +1 when
+# the centroid went to the left of the line (seen from its first point
+# towards its second), -1 otherwise
+Crossing = collections.namedtuple('Crossing', ['pts', 'track_id', 'lane', 'direction'])
+# start, end: interval in pts ns, counts: (lane, direction) to vehicles
+Counts = collections.namedtuple('Counts', ['camera_id', 'start', 'end', 'counts'])
+
+
+def iou_matrix(a, b):
+    """IoU of every box in a against every box in b
+
+    Args:
+        a (np.ndarray): (N, 4) x, y, w, h
+        b (np.ndarray): (M, 4) x, y, w, h
+
+    Returns:
+        np.ndarray: (N, M) float
+    """
+    a = a[:, None, :].astype(np.float64)
+    b = b[None, :, :].astype(np.float64)
+    w = np.minimum(a[..., 0] + a[..., 2], b[..., 0] + b[..., 2]) - np.maximum(a[..., 0], b[..., 0])
+    h = np.minimum(a[..., 1] + a[..., 3], b[..., 1] + b[..., 3]) - np.maximum(a[..., 1], b[..., 1])
+    inter = np.clip(w, 0, None) * np.clip(h, 0, None)
+    union = a[..., 2] * a[..., 3] + b[..., 2] * b[..., 3] - inter
+    return inter / np.maximum(union, 1e-9)
+
+
+def centroids(boxes):
+    return boxes[:, :2] + boxes[:, 2:4] / 2.0
+
+
+def mutual_best(score, valid, rounds=3):
+    """Greedy one-to-one matching without a per-pair loop
+
+    A row and a column are matched when each is the other's best; matched
+    rows and columns are masked out and the rest gets another round.
+
+    Args:
+        score (np.ndarray): (N, M) higher is better
+        valid (np.ndarray): (N, M) bool, pairs allowed to match
+        rounds (int, optional): Rounds at most
+
+    Returns:
+        tuple: (rows, cols) index arrays of the matches
+    """
+    score = np.where(valid, score, -np.inf)
+    rows, cols = [], []
+    for _ in range(rounds):
+        if not score.size or not np.isfinite(score).any():
+            break
+        best_col = score.argmax(axis=1)
+        best_row = score.argmax(axis=0)
+        r = np.arange(score.shape[0])
+        mutual = (best_row[best_col] == r) & np.isfinite(score[r, best_col])
+        r, c = r[mutual], best_col[mutual]
+        if not len(r):
+            break
+        rows.append(r)
+        cols.append(c)
+        score[r, :] = -np.inf
+        score[:, c] = -np.inf
+    if not rows:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    return np.concatenate(rows), np.concatenate(cols)
+
+
+class Tracker():
+    """IoU tracker with a centroid distance fallback
+
+    Track state lives in parallel arrays, so matching, updating and ageing
+    are vector operations.
+
+    Attributes:
+        boxes (np.ndarray): (K, 4) last box of every track
+        ids (np.ndarray): (K,) track ids
+        iou_threshold (float): Least IoU for an IoU match
+        max_age (int): Frames a track survives without a detection
+        max_distance (float): Furthest centroid jump for a distance match, in pixels
+    """
+
+    def __init__(self, iou_threshold=0.3, max_distance=60.0, max_age=5):
+        self.iou_threshold = iou_threshold
+        self.max_distance = max_distance
+        self.max_age = max_age
+        self.ids = np.empty(0, dtype=np.int64)
+        self.boxes = np.empty((0, 4), dtype=np.float64)
+        self.age = np.empty(0, dtype=np.int32)
+        self._next_id = 0
+
+    def update(self, boxes):
+        """Match this frame's detections to the tracks
+
+        Args:
+            boxes (np.ndarray): (N, 4) x, y, w, h detections
+
+        Returns:
+            tuple: (ids, previous, current) of the tracks seen in this frame
+                and in the one before: ids (T,), centroids (T, 2) each
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        k, n = len(self.ids), len(boxes)
+        track_c, box_c = centroids(self.boxes), centroids(boxes)
+
+        rows, cols = mutual_best(*self._iou(boxes))
+        track_free = np.ones(k, dtype=bool)
+        box_free = np.ones(n, dtype=bool)
+        track_free[rows] = box_free[cols] = False
+
+        # boxes that jumped too far to overlap: nearest centroid among what's left
+        if track_free.any() and box_free.any():
+            distance = np.linalg.norm(track_c[:, None, :] - box_c[None, :, :], axis=2)
+            valid = (distance <= self.max_distance) & track_free[:, None] & box_free[None, :]
+            r, c = mutual_best(-distance, valid)
+            rows, cols = np.concatenate([rows, r]), np.concatenate([cols, c])
+            track_free[r] = box_free[c] = False
+
+        ids, previous, current = self.ids[rows], track_c[rows], box_c[cols]
+        self.boxes[rows] = boxes[cols]
+        self.age[rows] = 0
+        self.age[track_free] += 1
+
+        new = np.flatnonzero(box_free)
+        keep = self.age <= self.max_age
+        self.ids = np.concatenate([self.ids[keep], np.arange(self._next_id, self._next_id + len(new))])
+        self.boxes = np.concatenate([self.boxes[keep], boxes[new]])
+        self.age = np.concatenate([self.age[keep], np.zeros(len(new), dtype=np.int32)])
+        self._next_id += len(new)
+        return ids, previous, current
+
+    def _iou(self, boxes):
+        iou = iou_matrix(self.boxes, boxes)
+        return iou, iou >= self.iou_threshold
+
+
+class LineCounter():
+    """Counts tracks whose centroid crosses a lane's line, per interval
+
+    The centroid step of every matched track is tested against every line
+    at once with orientation signs. Sides are half-open, a point exactly on
+    a line counts as right of it, so a centroid landing on the line is
+    counted once, on the step that reaches or leaves the left side. A track
+    is counted once per line.
+
+    Attributes:
+        interval (float): Seconds of pts per Counts
+        lanes (list): Lane names, in line order
+        tracker (Tracker): Tracker the crossings come from
+    """
+
+    def __init__(self, lines, interval=60.0, camera_id=None, tracker=None):
+        """Summary
+
+        Args:
+            lines (dict): Lane name to [x1, y1, x2, y2] in frame pixels
+            interval (float, optional): Seconds of pts per Counts
+            camera_id (object, optional): Reported with the Counts
+            tracker (Tracker, optional): Defaults to a Tracker()
+        """
+        self.lanes = list(lines)
+        self._a = np.array([lines[lane][:2] for lane in self.lanes], dtype=np.float64).reshape(-1, 2)
+        self._b = np.array([lines[lane][2:] for lane in self.lanes], dtype=np.float64).reshape(-1, 2)
+        self.interval = interval
+        self.camera_id = camera_id
+        self.tracker = tracker or Tracker()
+        self._counted = collections.OrderedDict()
+        self._counts = collections.Counter()
+        self._start = None
+
+    @staticmethod
+    def _side(a, b, p):
+        """Sign of the cross product (b - a) x (p - a), broadcasting"""
+        d = b - a
+        return np.sign(d[..., 0] * (p[..., 1] - a[..., 1]) - d[..., 1] * (p[..., 0] - a[..., 0]))
+
+    def crossings(self, previous, current):
+        """Which centroid steps cross which lines
+
+        Returns:
+            tuple: (step, line, direction) index arrays
+        """
+        p, q = previous[:, None, :], current[:, None, :]
+        a, b = self._a[None, :, :], self._b[None, :, :]
+        before, after = self._side(a, b, p) > 0, self._side(a, b, q) > 0
+        # the step changes side of the line and the line's ends are on both sides of the step
+        crossed = (before != after) & ((self._side(p, q, a) > 0) != (self._side(p, q, b) > 0))
+        step, line = np.nonzero(crossed)
+        # image y points down, so a positive cross product is left of the line
+        return step, line, np.where(after[step, line], -1, 1).astype(np.int64)
+
+    def update(self, pts, boxes):
+        """Track one frame's detections and count crossings
+
+        Args:
+            pts (int): Presentation time in ns
+            boxes (np.ndarray): (N, 4) x, y, w, h detections
+
+        Returns:
+            tuple: (crossings list, closed Counts list); both usually empty
+        """
+        closed = []
+        if self._start is None:
+            self._start = pts
+        while pts - self._start >= self.interval * 1e9:
+            closed.append(self.flush(self._start + int(self.interval * 1e9)))
+
+        ids, previous, current = self.tracker.update(boxes)
+        crossings = []
+        step, line, direction = self.crossings(previous, current)
+        for s, l, d in zip(step.tolist(), line.tolist(), direction.tolist()):
+            key = (int(ids[s]), l)
+            if key in self._counted:
+                continue
+            self._counted[key] = True
+            lane = self.lanes[l]
+            self._counts[(lane, d)] += 1
+            crossings.append(Crossing(pts, key[0], lane, d))
+        # ids only grow, forget the oldest once there are many
+        while len(self._counted) > 4096:
+            self._counted.popitem(last=False)
+        return crossings, closed
+
+    def flush(self, end=None):
+        """Close the current interval
+
+        Args:
+            end (int, optional): End of the interval in pts ns
+
+        Returns:
+            Counts: Counts of the interval, lanes without vehicles included as 0
+        """
+        counts = {(lane, d): self._counts.get((lane, d), 0) for lane in self.lanes for d in (1, -1)}
+        result = Counts(self.camera_id, self._start, end, counts)
+        self._counts = collections.Counter()
+        self._start = end
+        return result
+
+
+def load_lines(path):
+    """Camera id to {lane: [x1, y1, x2, y2]} from a JSON file"""
+    with open(path) as f:
+        return json.load(f)
+
+
+if __name__ == '__main__':
+    import pipelines
+    from capture import CaptureManager
+    from detector import detections
+
+    args = sys.argv[1:]
+    lines = {}
+    interval = 10.0
+    while args and args[0].startswith('--'):
+        flag, _, value = args.pop(0).partition('=')
+        if flag == '--lines':
+            lines = load_lines(value)
+        elif flag == '--interval':
+            interval = float(value)
+        else:
+            sys.exit('unknown option ' + flag)
+    args = args or ['1']
+    if args[0].isdigit():
+        configs = {'cam%d' % i: pipelines.testsrc(pattern=18, format='GRAY8')
+                   for i in range(int(args[0]))}
+    elif args[0].endswith('.json'):
+        configs = pipelines.load(args[0])
+    else:
+        configs = {path: pipelines.filesrc(path, format='GRAY8') for path in args}
+
+    # without a lines file: one horizontal line across the middle of a 1280x720 frame
+    counters = {camera_id: LineCounter(lines.get(camera_id, {'all': [0, 360, 1280, 360]}),
+                                       interval, camera_id)
+                for camera_id in configs}
+    manager = CaptureManager(configs)
+    try:
+        for result in detections(manager):
+            start = time.perf_counter()
+            crossings, closed = counters[result.camera_id].update(result.pts, result.boxes)
+            for crossing in crossings:
+                print('{} track {} crossed {} ({:+d}) in {:.2f} ms'.format(
+                    result.camera_id, crossing.track_id, crossing.lane, crossing.direction,
+                    (time.perf_counter() - start) * 1e3))
+            for counts in closed:
+                print(counts)
+    except KeyboardInterrupt:
+        pass
+
+    manager.stop()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# Moving vehicle blobs from background subtraction, one bounding box list
+# per frame.
+#
+# The model runs on a small grayscale plane (320 px wide by default). Have
+# the pipeline deliver it, e.g. pipelines.camset(format='GRAY8',
+# scale=[320, 210]), and Python does no conversion at all; BGR frames are
+# downscaled and converted here.
+#
+# usage: python detector.py [--average] [num-test-cameras | cameras.json | video files...]
+
+import collections
+import sys
+import time
+
+import cv2
+import numpy as np
+
+# boxes: (N, 4) int32 array of x, y, w, h in frame pixels
+Detections = collections.namedtuple('Detections', ['camera_id', 'pts', 'boxes'])
+
+NO_BOXES = np.empty((0, 4), dtype=np.int32)
+
+
+class MotionDetector():
+    """Incremental background model of one camera
+
+    'mog2' uses cv2's Gaussian mixture subtractor, which copes with
+    swaying trees and lighting changes; 'average' keeps a running average
+    (cv2.accumulateWeighted) and thresholds the difference, about twice as
+    fast. The foreground mask is cleaned with one opening and labelled with
+    connectedComponentsWithStats, which is cheaper than findContours.
+
+    Attributes:
+        method (string): 'mog2' or 'average'
+        min_area (int): Smallest blob kept, in pixels of the small plane
+        width (int): Width of the plane the model runs on
+    """
+
+    def __init__(self, method='mog2', width=320, min_area=40, alpha=0.02, threshold=25,
+                 history=300, var_threshold=25, warmup=10):
+        """Summary
+
+        Args:
+            method (string, optional): 'mog2' or 'average'
+            width (int, optional): Width of the plane the model runs on
+            min_area (int, optional): Smallest blob kept, in pixels of that plane
+            alpha (float, optional): Running average learning rate
+            threshold (int, optional): Running average difference threshold
+            history (int, optional): MOG2 history in frames
+            var_threshold (float, optional): MOG2 variance threshold
+            warmup (int, optional): Frames learnt before boxes are reported
+        """
+        if method not in ('mog2', 'average'):
+            raise ValueError('Unknown method: {}'.format(method))
+        self.method = method
+        self.width = width
+        self.min_area = min_area
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        self.frames = 0
+        self._background = None
+        self._kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+        if method == 'mog2':
+            self._mog2 = cv2.createBackgroundSubtractorMOG2(history, var_threshold, detectShadows=False)
+
+    def _plane(self, frame):
+        """Small grayscale plane of frame and the factor back to frame pixels"""
+        h, w = frame.shape[:2]
+        scale = w / self.width if w > self.width else 1.0
+        if scale != 1.0:
+            # shrink first, the colour conversion then touches a fraction of the pixels
+            frame = cv2.resize(frame, (self.width, int(round(h / scale))), interpolation=cv2.INTER_AREA)
+        if frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY if frame.shape[2] == 3 else cv2.COLOR_BGRA2GRAY)
+        return frame, scale
+
+    def mask(self, plane):
+        """Foreground mask of a small grayscale plane, updating the model"""
+        if self.method == 'mog2':
+            mask = self._mog2.apply(plane)
+        else:
+            if self._background is None:
+                self._background = plane.astype(np.float32)
+            difference = cv2.absdiff(plane, cv2.convertScaleAbs(self._background))
+            cv2.accumulateWeighted(plane, self._background, self.alpha)
+            _, mask = cv2.threshold(difference, self.threshold, 255, cv2.THRESH_BINARY)
+        return cv2.morphologyEx(mask, cv2.MORPH_OPEN, self._kernel)
+
+    def detect(self, frame):
+        """Bounding boxes of the moving blobs in frame
+
+        Args:
+            frame (np.ndarray): BGR, BGRx or grayscale frame, or an I420
+                tuple of planes (the luma plane is used)
+
+        Returns:
+            np.ndarray: (N, 4) int32 x, y, w, h in frame pixels
+        """
+        if isinstance(frame, tuple):
+            frame = frame[0]
+        plane, scale = self._plane(frame)
+        mask = self.mask(plane)
+        self.frames += 1
+        if self.frames <= self.warmup:
+            return NO_BOXES
+
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        # row 0 is the background
+        stats = stats[1:count]
+        boxes = stats[stats[:, cv2.CC_STAT_AREA] >= self.min_area, :4]
+        if scale != 1.0:
+            boxes = np.rint(boxes * scale)
+        return boxes.astype(np.int32)
+
+
+def detections(source, **options):
+    """Detect on everything read from a source, one MotionDetector per camera
+
+    Args:
+        source (object): CaptureManager or batcher.VideoCaptureSource, anything
+            with read(timeout) returning (camera_id, Frame) and a stopped property
+        **options: MotionDetector arguments
+
+    Yields:
+        Detections: Boxes of the next frame
+    """
+    detectors = {}
+    while True:
+        item = source.read(0.5)
+        if item is None:
+            if source.stopped:
+                return
+            continue
+        camera_id, frame = item
+        detector = detectors.get(camera_id)
+        if detector is None:
+            detector = detectors[camera_id] = MotionDetector(**options)
+        data = frame.data
+        if hasattr(data, 'release'):
+            # 'map' mode: work on the mapped buffer and unmap right away
+            with data as view:
+                boxes = detector.detect(view)
+        else:
+            boxes = detector.detect(data)
+            if hasattr(source, 'release'):
+                source.release(camera_id, data)
+        yield Detections(camera_id, frame.pts, boxes)
+
+
+if __name__ == '__main__':
+    import pipelines
+    from capture import CaptureManager
+
+    args = sys.argv[1:]
+    method = 'mog2'
+    if args and args[0] == '--average':
+        method = 'average'
+        args.pop(0)
+    args = args or ['1']
+    if args[0].isdigit():
+        # pattern 18 is a moving ball
+        configs = {'cam%d' % i: pipelines.testsrc(pattern=18, format='GRAY8', scale=[320, 180])
+                   for i in range(int(args[0]))}
+    elif args[0].endswith('.json'):
+        configs = pipelines.load(args[0])
+    else:
+        configs = {path: pipelines.filesrc(path, format='GRAY8') for path in args}
+
+    manager = CaptureManager(configs)
+    frames = 0
+    next_report = time.monotonic() + 1
+    try:
+        for result in detections(manager, method=method):
+            frames += 1
+            if time.monotonic() >= next_report:
+                next_report += 1
+                print('{} frames/s, {}: {} boxes {}'.format(
+                    frames, result.camera_id, len(result.boxes), result.boxes[:3].tolist()))
+                frames = 0
+    except KeyboardInterrupt:
+        pass
+
+    manager.stop()
@@ -0,0 +1,796 @@
+#!/usr/bin/env python
+# Live HLS straight from memory, replacing the hlssink commands in `gst cmds`
+# and the separate static file server.
+#
+# usage: python hls.py [--port=8080] [--low-latency] [--ladder] [--metrics=9108] [video file]
+#   then open http://<host>:8080/ (live-1.html) or point a player at
+#   http://<host>:8080/master.m3u8
+#
+# --low-latency serves LL-HLS partial segments with blocking playlist
+# reload and 1 s GOPs. Compare the clockoverlay timestamp in the player with
+# a wall clock for the glass-to-glass latency, bench-hls-latency.py
+# measures the server side of it.
+#
+# --ladder encodes every rung of LADDER from the one capture and lists them
+# in master.m3u8, so players switch renditions with their bandwidth.
+#
+# --metrics=PORT serves encoder bitrate (rate() of encoder_bytes_total) and
+# segment write times on http://<host>:PORT/metrics, see metrics.py.
+
+import asyncio
+import collections
+import math
+import os
+import sys
+import threading
+import time
+import zlib
+from email.utils import formatdate
+from urllib.parse import parse_qs
+
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+import metrics
+
+# seq: media sequence number, duration: seconds, data: MPEG-TS bytes,
+# etag: quoted entity tag sent with the segment, parts: its Parts
+Segment = collections.namedtuple('Segment', ['seq', 'duration', 'data', 'etag', 'parts'])
+# seq: segment the part belongs to, index: position in it, independent:
+# starts with a keyframe, captured: wall clock time its first frame was encoded,
+# None when the packager couldn't match it
+Part = collections.namedtuple('Part', ['seq', 'index', 'duration', 'data', 'independent', 'captured'])
+# name: URL directory of the rendition, bitrate: kbit/s
+Rung = collections.namedtuple('Rung', ['name', 'width', 'height', 'bitrate'])
+
+SEGMENT_NAME = 'segment_%05d.ts'
+PART_NAME = 'part_%05d.%d.ts'
+PLAYLIST_NAME = 'playlist.m3u8'
+MASTER_NAME = 'master.m3u8'
+# segments whose parts are still listed in a low latency playlist
+PART_SEGMENTS = 3
+
+# renditions of `gst cmds`' 1280x840 capture, highest first
+LADDER = [
+    Rung('840p', 1280, 840, 2500),
+    Rung('420p', 640, 420, 800),
+    Rung('210p', 320, 210, 250),
+]
+
+CONTENT_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.ts': 'video/mp2t',
+    '.html': 'text/html; charset=utf-8',
+}
+
+
+def camera_source(sensor_id=0, width=1280, height=840, flip=2, framerate=30):
+    """CSI camera as in `gst cmds`, raw video in system memory
+
+    Returns:
+        list: Pipeline description list
+    """
+    return [
+        'nvarguscamerasrc sensor-id={}'.format(sensor_id),
+        '! video/x-raw(memory:NVMM), framerate={}/1'.format(framerate),
+        '! nvvidconv flip-method={}'.format(flip),
+        '! video/x-raw, width={}, height={}'.format(width, height),
+    ]
+
+
+def file_source(path, width=1280, height=840):
+    """Recorded file played at its own rate
+
+    Returns:
+        list: Pipeline description list
+    """
+    return [
+        'filesrc location="{}"'.format(path),
+        '! decodebin ! videoconvert ! videoscale',
+        '! video/x-raw, width={}, height={}'.format(width, height),
+    ]
+
+
+def encoder(bitrate=2000, key_int_max=30, overlay=True):
+    """x264 in zero latency mode, as in `gst cmds`
+
+    Segments can only start on a keyframe, so key_int_max bounds how close
+    segment durations get to the target.
+
+    Args:
+        bitrate (int, optional): kbit/s
+        key_int_max (int, optional): Maximum GOP length in frames
+        overlay (bool, optional): Burn in the clockoverlay timestamp
+
+    Returns:
+        list: Pipeline description list
+    """
+    config = ['! videoconvert']
+    if overlay:
+        config.append('! clockoverlay')
+    config += [
+        '! x264enc name=encoder tune=zerolatency bitrate={} key-int-max={}'.format(bitrate, key_int_max),
+        '! video/x-h264, profile=main',
+    ]
+    return config
+
+
+def low_latency(framerate=30, gop=1.0, part_target=0.334, segments_per_gop=1):
+    """Ring and encoder settings for LL-HLS
+
+    Segments must start on a keyframe, so the target duration is a whole
+    number of GOPs and the encoder's key-int-max follows from the GOP length.
+    Parts are cut on any frame boundary.
+
+    Args:
+        framerate (int, optional): Capture framerate
+        gop (float, optional): GOP length in seconds
+        part_target (float, optional): Partial segment target in seconds
+        segments_per_gop (int, optional): GOPs per segment
+
+    Returns:
+        tuple: (SegmentRing, encoder config list)
+    """
+    ring = SegmentRing(target_duration=gop * segments_per_gop, playlist_length=6, size=10,
+                       part_target=part_target)
+    return ring, encoder(key_int_max=int(round(framerate * gop)))
+
+
+def ladder(rungs=LADDER, key_int_max=30, overlay=True):
+    """Convert (and overlay) once, then scale and encode once per rung
+
+    The converted frames are teed into one branch per rung, each ending in
+    ts_sink('hls_<rung name>') with its x264enc named 'encoder_<rung name>'.
+    Scene cut detection is off so every rung puts its keyframes on the same
+    frames and segment boundaries line up for switching. A rung at the
+    capture size skips videoscale's work.
+
+    Args:
+        rungs (list, optional): Rungs to encode
+        key_int_max (int, optional): GOP length in frames, the same on all rungs
+        overlay (bool, optional): Burn in the clockoverlay timestamp
+
+    Returns:
+        list: Pipeline description list
+    """
+    config = ['! videoconvert']
+    if overlay:
+        config.append('! clockoverlay')
+    config.append('! tee name=ladder')
+    for rung in rungs:
+        config += [
+            'ladder. ! queue',
+            '! videoscale ! video/x-raw, width={}, height={}'.format(rung.width, rung.height),
+            '! x264enc name=encoder_{} tune=zerolatency bitrate={} key-int-max={} option-string=scenecut=0'.format(
+                rung.name, rung.bitrate, key_int_max),
+            '! video/x-h264, profile=main',
+        ]
+        config += ts_sink('hls_' + rung.name)
+    return config
+
+
+def master_playlist(rungs):
+    """Master playlist listing the media playlist of every rung
+
+    BANDWIDTH is the encoder bitrate plus ~10% MPEG-TS overhead. A rung
+    named '' points at the top level playlist.
+
+    Returns:
+        bytes: Playlist
+    """
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3']
+    for rung in rungs:
+        lines.append('#EXT-X-STREAM-INF:BANDWIDTH={},RESOLUTION={}x{}'.format(
+            int(rung.bitrate * 1100), rung.width, rung.height))
+        lines.append(rung.name + '/' + PLAYLIST_NAME if rung.name else PLAYLIST_NAME)
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def ts_sink(name='hls'):
+    """MPEG-TS muxed into an appsink HlsPackager reads
+
+    Returns:
+        list: Pipeline description list
+    """
+    return [
+        '! h264parse ! mpegtsmux name={}_mux alignment=7'.format(name),
+        '! appsink name={} emit-signals=true sync=false max-buffers=0'.format(name),
+    ]
+
+
+class SegmentRing():
+    """Last few segments of a live stream and the playlist describing them
+
+    The playlist lists playlist_length segments while the ring keeps size of
+    them, so a player fetching a segment that just left the playlist still
+    gets it. The playlist is rendered once per update, not once per request.
+
+    With part_target set the playlist is LL-HLS: the parts of the last few
+    segments and of the segment being built are listed as EXT-X-PART, the
+    next one as EXT-X-PRELOAD-HINT, and players may block on the next update.
+
+    Attributes:
+        part_target (float): Partial segment target in seconds, None for plain HLS
+        playlist (bytes): Current media playlist
+        playlist_etag (string): Entity tag of the playlist
+        playlist_length (int): Segments listed in the playlist
+        target_duration (float): Target segment duration in seconds
+    """
+
+    def __init__(self, target_duration=2.0, playlist_length=5, size=8, part_target=None):
+        self.target_duration = target_duration
+        self.playlist_length = playlist_length
+        self.part_target = part_target
+        self._segments = collections.OrderedDict()
+        self._parts = []
+        self._next_seq = 0
+        self._size = max(size, playlist_length)
+        self._lock = threading.Lock()
+        self._listeners = []
+        self.playlist = b''
+        self.playlist_etag = '"empty"'
+        self._render()
+
+    def add_listener(self, callback):
+        """Call callback() from the packager thread after every update"""
+        self._listeners.append(callback)
+
+    def _notify(self):
+        for callback in self._listeners:
+            callback()
+
+    def add_part(self, duration, data, independent, captured=None):
+        """Append a part to the segment being built, called from the packager thread"""
+        with self._lock:
+            self._parts.append(Part(self._next_seq, len(self._parts), duration, data,
+                                    independent, captured))
+            if self.part_target:
+                self._render()
+        if self.part_target:
+            self._notify()
+
+    def close_segment(self):
+        """Turn the parts added so far into a segment, called from the packager thread"""
+        with self._lock:
+            if not self._parts:
+                return
+            seq, parts = self._next_seq, self._parts
+            data = b''.join(part.data for part in parts)
+            duration = sum(part.duration for part in parts)
+            self._segments[seq] = Segment(seq, duration, data, '"{}-{}"'.format(seq, len(data)), parts)
+            self._next_seq += 1
+            self._parts = []
+            while len(self._segments) > self._size:
+                self._segments.popitem(last=False)
+            self._render()
+        self._notify()
+
+    def add(self, duration, data):
+        """Append a finished segment in one go"""
+        self.add_part(duration, data, True)
+        self.close_segment()
+
+    def get(self, seq):
+        with self._lock:
+            return self._segments.get(seq)
+
+    def get_part(self, seq, index):
+        with self._lock:
+            if seq == self._next_seq:
+                parts = self._parts
+            elif seq in self._segments:
+                parts = self._segments[seq].parts
+            else:
+                return None
+            return parts[index] if index < len(parts) else None
+
+    def has(self, seq, part=None):
+        """Check if segment seq (or its part) is out, for blocking reloads
+
+        Args:
+            seq (int): Media sequence number
+            part (int, optional): Part index within the segment
+
+        Returns:
+            bool: true if a playlist listing it has been rendered
+        """
+        with self._lock:
+            if seq < self._next_seq:
+                return True
+            return seq == self._next_seq and part is not None and part < len(self._parts)
+
+    def _part_lines(self, parts):
+        lines = []
+        for part in parts:
+            lines.append('#EXT-X-PART:DURATION={:.3f},URI="{}"{}'.format(
+                part.duration, PART_NAME % (part.seq, part.index),
+                ',INDEPENDENT=YES' if part.independent else ''))
+        return lines
+
+    def _render(self):
+        listed = list(self._segments.values())[-self.playlist_length:]
+        target = max([self.target_duration] + [segment.duration for segment in listed])
+        lines = [
+            '#EXTM3U',
+            '#EXT-X-VERSION:{}'.format(6 if self.part_target else 3),
+            '#EXT-X-TARGETDURATION:{}'.format(int(math.ceil(target))),
+        ]
+        if self.part_target:
+            part_target = max([self.part_target] + [part.duration for part in self._parts] +
+                              [part.duration for segment in listed[-PART_SEGMENTS:]
+                               for part in segment.parts])
+            lines += [
+                '#EXT-X-SERVER-CONTROL:CAN-BLOCK-RELOAD=YES,PART-HOLD-BACK={:.3f}'.format(3 * part_target),
+                '#EXT-X-PART-INF:PART-TARGET={:.3f}'.format(part_target),
+            ]
+        lines.append('#EXT-X-MEDIA-SEQUENCE:{}'.format(listed[0].seq if listed else self._next_seq))
+        for i, segment in enumerate(listed):
+            if self.part_target and i >= len(listed) - PART_SEGMENTS:
+                lines += self._part_lines(segment.parts)
+            lines.append('#EXTINF:{:.3f},'.format(segment.duration))
+            lines.append(SEGMENT_NAME % segment.seq)
+        if self.part_target:
+            lines += self._part_lines(self._parts)
+            lines.append('#EXT-X-PRELOAD-HINT:TYPE=PART,URI="{}"'.format(
+                PART_NAME % (self._next_seq, len(self._parts))))
+        self.playlist = ('\n'.join(lines) + '\n').encode()
+        self.playlist_etag = '"p{}.{}"'.format(self._next_seq, len(self._parts))
+
+
+class HlsPackager():
+    """Cuts the muxed transport stream into segments on keyframes
+
+    mpegtsmux clears the DELTA_UNIT flag on buffers starting a keyframe. A
+    new segment starts at the first keyframe once the current one has
+    reached the target duration. In low latency mode parts are cut on the
+    first frame boundary that would overshoot the part target.
+
+    Part.captured is when the part's first frame reached the encoder. The
+    encoder keeps pts, but the muxer stamps its output with the running time
+    of the frame's dts, so capture times are re-keyed on that timeline where
+    frames enter the muxer. Parts whose first frame can't be matched get
+    captured None and are counted in captured_misses.
+
+    Attributes:
+        captured_misses (int): Parts without a capture time
+        pipeline (Gst.Pipeline): Capture/encode/mux pipeline
+        ring (SegmentRing): Where finished segments go
+    """
+
+    def __init__(self, config, ring, sink_name='hls', write_time=None, encoder_name='encoder'):
+        """Summary
+
+        Args:
+            config (list): Pipeline description list ending in ts_sink(sink_name),
+                or a Gst.Pipeline shared with other packagers
+            ring (SegmentRing): Where finished segments go
+            sink_name (string, optional): Name of the appsink
+            write_time (object, optional): Histogram child (see metrics.py)
+                observing how long storing a finished segment takes
+            encoder_name (string, optional): Name of the x264enc feeding the sink
+        """
+        Gst.init(None)
+        self.ring = ring
+        self.write_time = write_time
+        if isinstance(config, Gst.Pipeline):
+            self.pipeline = config
+        else:
+            self.pipeline = Gst.parse_launch(' '.join(config))
+        self._chunks = []
+        self._segment_start = None
+        self._part_start = None
+        self._part_independent = False
+        self._part_captured = None
+        self._last_pts = None
+        self._frame_interval = 0
+        # encoder input pts to wall clock, then muxer timeline to wall clock
+        self._encoded = collections.OrderedDict()
+        self._captured = collections.OrderedDict()
+        self.captured_misses = 0
+        sink = self.pipeline.get_by_name(sink_name)
+        sink.connect('new-sample', self._on_sample)
+
+        # remember when each frame reached the encoder, for Part.captured
+        encoder = self.pipeline.get_by_name(encoder_name)
+        mux = self.pipeline.get_by_name(sink_name + '_mux')
+        if encoder is not None and mux is not None:
+            encoder.get_static_pad('sink').add_probe(Gst.PadProbeType.BUFFER, self._on_encode)
+            for pad in mux.sinkpads:
+                pad.add_probe(Gst.PadProbeType.BUFFER, self._on_mux)
+
+    @staticmethod
+    def _remember(table, key, value):
+        table[key] = value
+        if len(table) > 256:
+            table.popitem(last=False)
+
+    def _on_encode(self, pad, info):
+        self._remember(self._encoded, info.get_buffer().pts, time.time())
+        return Gst.PadProbeReturn.OK
+
+    def _on_mux(self, pad, info):
+        buf = info.get_buffer()
+        captured = self._encoded.pop(buf.pts, None)
+        if captured is None:
+            return Gst.PadProbeReturn.OK
+        timestamp = buf.dts if buf.dts != Gst.CLOCK_TIME_NONE else buf.pts
+        event = pad.get_sticky_event(Gst.EventType.SEGMENT, 0)
+        if event is not None:
+            timestamp = event.parse_segment().to_running_time(Gst.Format.TIME, timestamp)
+        self._remember(self._captured, timestamp, captured)
+        return Gst.PadProbeReturn.OK
+
+    def start(self):
+        self.pipeline.set_state(Gst.State.PLAYING)
+
+    def stop(self):
+        self.pipeline.set_state(Gst.State.NULL)
+
+    def _now(self, buf):
+        """Stream time of buf in seconds, None when the muxer left pts out"""
+        if buf.pts != Gst.CLOCK_TIME_NONE:
+            return buf.pts / Gst.SECOND
+        return None
+
+    def _on_sample(self, sink):
+        buf = sink.emit('pull-sample').get_buffer()
+        keyframe = not buf.has_flags(Gst.BufferFlags.DELTA_UNIT)
+        now = self._now(buf)
+        if now is not None:
+            if self._last_pts is not None and now > self._last_pts:
+                self._frame_interval = now - self._last_pts
+            self._last_pts = now
+
+        if self._segment_start is None:
+            # wait for the first keyframe
+            if not keyframe or now is None:
+                return Gst.FlowReturn.OK
+            self._start_part(buf, now, keyframe)
+            self._segment_start = now
+        elif keyframe and now is not None and now - self._segment_start >= self.ring.target_duration:
+            self._write(now, close=True)
+            self._start_part(buf, now, keyframe)
+            self._segment_start = now
+        elif (self.ring.part_target and now is not None and
+                now - self._part_start + self._frame_interval > self.ring.part_target):
+            self._write(now)
+            self._start_part(buf, now, keyframe)
+
+        self._chunks.append(buf.extract_dup(0, buf.get_size()))
+        return Gst.FlowReturn.OK
+
+    def _start_part(self, buf, now, keyframe):
+        self._part_start = now
+        self._part_independent = keyframe
+        self._part_captured = self._captured.get(buf.pts)
+        if self._part_captured is None:
+            self.captured_misses += 1
+
+    def _write(self, now, close=False):
+        start = time.perf_counter()
+        if self._chunks:
+            self.ring.add_part(now - self._part_start, b''.join(self._chunks),
+                               self._part_independent, self._part_captured)
+            self._chunks = []
+        if close:
+            self.ring.close_segment()
+            if self.write_time is not None:
+                self.write_time.observe(time.perf_counter() - start)
+
+
+class LadderPackager():
+    """Packages every rung of a ladder() pipeline into its own SegmentRing
+
+    All rungs share one pipeline, so the capture, decode and conversion run
+    once however many rungs there are.
+
+    Attributes:
+        master (bytes): Master playlist, see master_playlist()
+        packagers (list): HlsPackager per rung
+        pipeline (Gst.Pipeline): Capture, tee and per-rung encoders
+        rings (dict): Rung name to SegmentRing, for HlsServer
+    """
+
+    def __init__(self, source, rungs=LADDER, target_duration=2.0, playlist_length=5, size=8,
+                 part_target=None, key_int_max=30, overlay=True, write_time=None):
+        """Summary
+
+        Args:
+            source (list): Pipeline description list of raw video, e.g. camera_source()
+            rungs (list, optional): Rungs to encode
+            target_duration (float, optional): Segment target of every ring
+            playlist_length (int, optional): Segments listed per media playlist
+            size (int, optional): Segments kept per ring
+            part_target (float, optional): LL-HLS part target, None for plain HLS
+            key_int_max (int, optional): GOP length in frames
+            overlay (bool, optional): Burn in the clockoverlay timestamp
+            write_time (object, optional): Histogram with a 'sink' label (see
+                metrics.py), every rung observes into its own child
+        """
+        Gst.init(None)
+        self.pipeline = Gst.parse_launch(' '.join(source + ladder(rungs, key_int_max, overlay)))
+        self.master = master_playlist(rungs)
+        self.rings = collections.OrderedDict()
+        self.packagers = []
+        for rung in rungs:
+            ring = SegmentRing(target_duration, playlist_length, size, part_target)
+            self.rings[rung.name] = ring
+            sink_name = 'hls_' + rung.name
+            self.packagers.append(HlsPackager(
+                self.pipeline, ring, sink_name,
+                None if write_time is None else write_time.labels(sink=sink_name),
+                encoder_name='encoder_' + rung.name))
+
+    def start(self):
+        self.pipeline.set_state(Gst.State.PLAYING)
+
+    def stop(self):
+        self.pipeline.set_state(Gst.State.NULL)
+
+
+class HlsServer():
+    """Serves the playlist and segments of SegmentRings over asyncio
+
+    Minimal HTTP/1.1 with keep-alive, ETag/If-None-Match and single byte
+    ranges. Every viewer is a coroutine reading shared immutable bytes, so
+    viewers cost memory for their socket only.
+
+    LL-HLS blocking requests (_HLS_msn/_HLS_part on the playlist, the
+    preload hinted part) wait for the packager instead of polling.
+
+    Rings given as a dict are served under /<name>/, e.g. the rings of a
+    LadderPackager, with master listing them.
+
+    Attributes:
+        files (dict): Extra static files, URL path to local path
+        master (bytes): Master playlist served as master.m3u8, or None
+        rings (dict): Directory name to SegmentRing, '' for the top level
+    """
+
+    def __init__(self, ring, host='0.0.0.0', port=8080, files=None, master=None):
+        self.rings = ring if isinstance(ring, dict) else {'': ring}
+        self.master = master
+        self.host = host
+        self.port = port
+        self.files = files or {}
+        self._static = {}
+        self._changed = None
+        # longest a blocking request waits, the spec asks for three target durations
+        self.block_timeout = 3 * max(ring.target_duration for ring in self.rings.values())
+
+    def _on_ring_changed(self):
+        # runs on the loop: wake everyone waiting and arm a fresh event
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def _wait_for(self, predicate):
+        """Wait until predicate() holds, False on timeout"""
+        deadline = time.monotonic() + self.block_timeout
+        while not predicate():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                return predicate()
+        return True
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        self._changed = asyncio.Event()
+        for ring in self.rings.values():
+            ring.add_listener(lambda: loop.call_soon_threadsafe(self._on_ring_changed))
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        async with server:
+            await server.serve_forever()
+
+    def run(self):
+        asyncio.run(self.serve())
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request = await reader.readline()
+                if not request:
+                    break
+                try:
+                    method, target, version = request.decode('latin-1').split()
+                except ValueError:
+                    await self._respond(writer, 400, b'', {})
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                path, _, query = target.partition('?')
+                await self._dispatch(writer, method, path, parse_qs(query), headers, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, writer, method, path, query, headers, keep_alive):
+        if method not in ('GET', 'HEAD'):
+            await self._respond(writer, 405, b'', {}, keep_alive)
+            return
+
+        try:
+            found = await self._lookup(path, query)
+        except ValueError:
+            await self._respond(writer, 400, b'', {}, keep_alive)
+            return
+        if found is None:
+            await self._respond(writer, 404, b'', {}, keep_alive)
+            return
+        body, etag, extra = found
+
+        response = {'ETag': etag, 'Accept-Ranges': 'bytes'}
+        response.update(extra)
+        response['Content-Type'] = CONTENT_TYPES.get(os.path.splitext(path)[1] or '.html',
+                                                     'application/octet-stream')
+        if headers.get('if-none-match') == etag:
+            await self._respond(writer, 304, b'', response, keep_alive)
+            return
+
+        status, body = self._range(body, headers.get('range'), response)
+        await self._respond(writer, status, b'' if method == 'HEAD' else body, response,
+                            keep_alive, len(body))
+
+    async def _lookup(self, path, query):
+        """Body, etag and extra headers of path, None if unknown
+
+        Raises ValueError on malformed names or query parameters.
+        """
+        if path.lstrip('/') == MASTER_NAME and self.master is not None:
+            return self.master, '"m{:08x}"'.format(zlib.crc32(self.master)), {'Cache-Control': 'no-cache'}
+        directory, _, name = path.lstrip('/').rpartition('/')
+        ring = self.rings.get(directory)
+        if ring is not None:
+            found = await self._lookup_ring(ring, name, query)
+            if found is not None:
+                return found
+        if path in self.files:
+            if path not in self._static:
+                with open(self.files[path], 'rb') as f:
+                    data = f.read()
+                self._static[path] = data, '"s{:08x}"'.format(zlib.crc32(data))
+            data, etag = self._static[path]
+            return data, etag, {}
+        return None
+
+    async def _lookup_ring(self, ring, name, query):
+        if name == PLAYLIST_NAME:
+            if '_HLS_msn' in query:
+                seq = int(query['_HLS_msn'][0])
+                part = int(query['_HLS_part'][0]) if '_HLS_part' in query else None
+                await self._wait_for(lambda: ring.has(seq, part))
+            return ring.playlist, ring.playlist_etag, {'Cache-Control': 'no-cache'}
+        if name.startswith('segment_') and name.endswith('.ts'):
+            segment = ring.get(int(name[len('segment_'):-len('.ts')]))
+            if segment is None:
+                return None
+            return segment.data, segment.etag, {'Cache-Control': 'max-age=60'}
+        if name.startswith('part_') and name.endswith('.ts'):
+            seq, index = (int(n) for n in name[len('part_'):-len('.ts')].split('.'))
+            # the preload hint names the part being built, hold the request until it's out
+            if not await self._wait_for(lambda: ring.get_part(seq, index) is not None):
+                return None
+            part = ring.get_part(seq, index)
+            return part.data, '"{}.{}-{}"'.format(seq, index, len(part.data)), {'Cache-Control': 'max-age=60'}
+        return None
+
+    @staticmethod
+    def _range(body, value, response):
+        """Apply a single 'bytes=a-b' range, multiple ranges get the full body"""
+        if not value or not value.startswith('bytes=') or ',' in value:
+            return 200, body
+        start, _, end = value[len('bytes='):].partition('-')
+        size = len(body)
+        try:
+            if start:
+                start = int(start)
+                end = min(int(end), size - 1) if end else size - 1
+            else:
+                start = max(size - int(end), 0)
+                end = size - 1
+        except ValueError:
+            return 200, body
+        if start > end or start >= size:
+            response['Content-Range'] = 'bytes */{}'.format(size)
+            return 416, b''
+        response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+        return 206, body[start:end + 1]
+
+    @staticmethod
+    async def _respond(writer, status, body, headers, keep_alive=False, length=None):
+        reasons = {200: 'OK', 206: 'Partial Content', 304: 'Not Modified', 400: 'Bad Request',
+                   404: 'Not Found', 405: 'Method Not Allowed', 416: 'Range Not Satisfiable'}
+        lines = ['HTTP/1.1 {} {}'.format(status, reasons.get(status, ''))]
+        headers = dict(headers)
+        headers['Date'] = formatdate(usegmt=True)
+        headers['Access-Control-Allow-Origin'] = '*'
+        headers['Connection'] = 'keep-alive' if keep_alive else 'close'
+        if status != 304:
+            headers['Content-Length'] = str(len(body) if length is None else length)
+        for name, value in headers.items():
+            lines.append('{}: {}'.format(name, value))
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        if body:
+            writer.write(body)
+        await writer.drain()
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    port = 8080
+    metrics_port = None
+    low = abr = False
+    while args and args[0].startswith('--'):
+        flag = args.pop(0)
+        if flag.startswith('--port='):
+            port = int(flag.split('=', 1)[1])
+        elif flag.startswith('--metrics='):
+            metrics_port = int(flag.split('=', 1)[1])
+        elif flag == '--low-latency':
+            low = True
+        elif flag == '--ladder':
+            abr = True
+        else:
+            sys.exit('unknown option ' + flag)
+
+    registry = write_time = None
+    if metrics_port:
+        registry = metrics.Registry()
+        # same metric as metrics.watch_hlssink(), for hlssink2 pipelines
+        write_time = registry.histogram(
+            'hls_segment_write_seconds', 'Time to finish writing an HLS segment', ['sink'])
+
+    source = file_source(args[0]) if args else camera_source()
+    if abr and low:
+        packager = LadderPackager(source, target_duration=1.0, playlist_length=6, size=10,
+                                  part_target=0.334, write_time=write_time)
+    elif abr:
+        packager = LadderPackager(source, write_time=write_time)
+    if abr:
+        rings, master = packager.rings, packager.master
+        encoders = ['encoder_' + rung.name for rung in LADDER]
+        sinks = zip(['hls_' + rung.name for rung in LADDER], packager.packagers)
+    else:
+        if low:
+            ring, encode = low_latency()
+        else:
+            ring, encode = SegmentRing(target_duration=2.0, playlist_length=5, size=8), encoder()
+        packager = HlsPackager(source + encode + ts_sink(), ring,
+                               write_time=None if write_time is None else write_time.labels(sink='hls'))
+        # a one rung master playlist, so live-1.html plays either mode
+        rings, master = ring, master_playlist([Rung('', 1280, 840, 2000)])
+        encoders = ['encoder']
+        sinks = [('hls', packager)]
+    if registry is not None:
+        for name in encoders:
+            metrics.watch_encoder(registry, packager.pipeline.get_by_name(name))
+        misses = registry.counter('hls_parts_uncaptured_total',
+                                  'Parts whose first frame had no encoder input time', ['sink'])
+        for sink, sink_packager in sinks:
+            misses.set_function(lambda p=sink_packager: p.captured_misses, sink=sink)
+        metrics.MetricsServer(registry, metrics_port).start()
+    index = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'live-1.html')
+    server = HlsServer(rings, port=port, files={'/': index, '/index.html': index}, master=master)
+
+    packager.start()
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        packager.stop()
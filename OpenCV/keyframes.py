@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+# Keyframe positions of a recording, read from the demuxed stream without
+# decoding it, and frame accurate random access on top of them.
+#
+# The positions are kept in a sidecar file next to the recording, so the
+# scan runs once per file. A jump seeks straight to the keyframe before the
+# wanted frame and decodes only up to it; decoded GOPs stay in an LRU cache.
+#
+#     index = KeyframeIndex('road.mp4')
+#     pts, frame = index.get_frame(42.5)
+#     for pts, frame in index.get_range(40, 45):
+#         ...
+#
+# usage: python keyframes.py <video file> [random-jumps]
+
+import bisect
+import collections
+import json
+import os
+import random
+import sys
+import time
+
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+from vid import Video
+
+SIDECAR = '.keyframes.json'
+
+
+def scan(path):
+    """Presentation times of the keyframes and of all frames of a file
+
+    parsebin demuxes and parses the video stream; keyframes are the buffers
+    without the DELTA_UNIT flag. Other streams go to a fakesink.
+
+    Args:
+        path (string): Video file
+
+    Returns:
+        tuple: (keyframes, frames) sorted lists of pts in ns
+    """
+    Gst.init(None)
+    pipeline = Gst.parse_launch('filesrc location="{}" ! parsebin name=parse'.format(path))
+    sink = Gst.ElementFactory.make('appsink')
+    sink.set_property('sync', False)
+    pipeline.add(sink)
+
+    def on_pad_added(element, pad):
+        caps = pad.get_current_caps() or pad.query_caps(None)
+        if caps.get_structure(0).get_name().startswith('video/') and not sink.get_static_pad('sink').is_linked():
+            pad.link(sink.get_static_pad('sink'))
+            return
+        fake = Gst.ElementFactory.make('fakesink')
+        fake.set_property('sync', False)
+        pipeline.add(fake)
+        fake.sync_state_with_parent()
+        pad.link(fake.get_static_pad('sink'))
+
+    pipeline.get_by_name('parse').connect('pad-added', on_pad_added)
+    pipeline.set_state(Gst.State.PLAYING)
+
+    bus = pipeline.get_bus()
+    keyframes, frames = [], []
+    message = None
+    while True:
+        sample = sink.try_pull_sample(Gst.SECOND)
+        if sample is None:
+            # EOS, or nothing coming: an error or a file without video
+            if sink.is_eos():
+                break
+            message = bus.pop_filtered(Gst.MessageType.ERROR)
+            if message is not None or not sink.get_static_pad('sink').is_linked():
+                break
+            continue
+        buf = sample.get_buffer()
+        if buf.pts == Gst.CLOCK_TIME_NONE:
+            continue
+        frames.append(buf.pts)
+        if not buf.has_flags(Gst.BufferFlags.DELTA_UNIT):
+            keyframes.append(buf.pts)
+
+    message = message or bus.pop_filtered(Gst.MessageType.ERROR)
+    pipeline.set_state(Gst.State.NULL)
+    if message is not None:
+        err, debug = message.parse_error()
+        raise IOError('{}: {}'.format(path, err.message))
+    # demuxers hand out decode order, B-frames make pts go back and forth
+    return sorted(keyframes), sorted(frames)
+
+
+class KeyframeIndex():
+    """Frame accurate random access to a recording
+
+    Attributes:
+        cache_size (int): Bytes of decoded frames kept
+        frames (list): Sorted pts of every frame in ns
+        keyframes (list): Sorted pts of the keyframes in ns
+        path (string): Video file
+    """
+
+    def __init__(self, path, cache_size=256 * 2**20):
+        """Summary
+
+        Args:
+            path (string): Video file, the index goes to path + SIDECAR
+            cache_size (int, optional): Bytes of decoded frames to keep
+        """
+        Gst.init(None)
+        self.path = path
+        self.cache_size = cache_size
+        self.keyframes, self.frames = self._load()
+        # GOP number to the (pts, frame) list decoded so far from its keyframe
+        self._cache = collections.OrderedDict()
+        self._cached_bytes = 0
+        self._pipeline = None
+        self._sink = None
+        self._pending = None
+        self._next_pts = None
+
+    def _load(self):
+        """Index from the sidecar, scanning the file if it's missing or stale"""
+        stat = os.stat(self.path)
+        sidecar = self.path + SIDECAR
+        try:
+            with open(sidecar) as f:
+                data = json.load(f)
+            if data['size'] == stat.st_size and data['mtime'] == stat.st_mtime:
+                return data['keyframes'], data['frames']
+        except (OSError, ValueError, KeyError):
+            pass
+        keyframes, frames = scan(self.path)
+        try:
+            with open(sidecar, 'w') as f:
+                json.dump({'size': stat.st_size, 'mtime': stat.st_mtime,
+                           'keyframes': keyframes, 'frames': frames}, f)
+        except OSError:
+            # read-only media, keep the index in memory only
+            pass
+        return keyframes, frames
+
+    def frame_index(self, t):
+        """Index of the frame shown at t seconds"""
+        return max(bisect.bisect_right(self.frames, int(t * Gst.SECOND)) - 1, 0)
+
+    def _gop_of(self, pts):
+        return max(bisect.bisect_right(self.keyframes, pts) - 1, 0)
+
+    def get_frame(self, t):
+        """Frame shown at t seconds
+
+        Returns:
+            tuple: (pts in ns, BGR frame), None past the end
+        """
+        if not self.frames:
+            return None
+        pts = self.frames[self.frame_index(t)]
+        for item in reversed(self._gop(self._gop_of(pts), pts)):
+            if item[0] <= pts:
+                return item
+        return None
+
+    def get_range(self, t0, t1):
+        """Frames shown from t0 up to t1 seconds
+
+        Returns:
+            list: (pts in ns, BGR frame) in presentation order
+        """
+        lo = self.frame_index(t0)
+        hi = bisect.bisect_left(self.frames, int(t1 * Gst.SECOND))
+        if hi <= lo:
+            return []
+        start, end = self.frames[lo], self.frames[hi - 1]
+        result = []
+        for gop in range(self._gop_of(start), self._gop_of(end) + 1):
+            upto = end
+            if gop + 1 < len(self.keyframes):
+                # last frame of this GOP
+                upto = min(end, self.frames[bisect.bisect_left(self.frames, self.keyframes[gop + 1]) - 1])
+            result += [item for item in self._gop(gop, upto) if start <= item[0] <= end]
+        return result
+
+    def _gop(self, gop, upto):
+        """Decoded frames of a GOP from its keyframe up to at least pts upto"""
+        cached = self._cache.get(gop)
+        if cached is not None:
+            self._cache.move_to_end(gop)
+            if cached[-1][0] >= upto:
+                return cached
+            self._cached_bytes -= sum(frame.nbytes for _, frame in cached)
+            start = self.frames[bisect.bisect_right(self.frames, cached[-1][0])]
+        else:
+            cached = []
+            start = self.keyframes[gop] if self.keyframes else self.frames[0]
+
+        self._position(start, self.keyframes[gop] if self.keyframes else 0)
+        while True:
+            item = self._pull()
+            if item is None:
+                break
+            cached.append(item)
+            if item[0] >= upto:
+                break
+
+        self._cache[gop] = cached
+        self._cached_bytes += sum(frame.nbytes for _, frame in cached)
+        while self._cached_bytes > self.cache_size and len(self._cache) > 1:
+            _, evicted = self._cache.popitem(last=False)
+            self._cached_bytes -= sum(frame.nbytes for _, frame in evicted)
+        return cached
+
+    def _start(self):
+        self._pipeline = Gst.parse_launch(
+            'filesrc location="{}" ! decodebin ! videoconvert ! video/x-raw, format=BGR '
+            '! appsink name=sink sync=false max-buffers=8'.format(self.path))
+        self._sink = self._pipeline.get_by_name('sink')
+        self._pipeline.set_state(Gst.State.PAUSED)
+        self._pipeline.get_state(Gst.CLOCK_TIME_NONE)
+        self._pipeline.set_state(Gst.State.PLAYING)
+
+    def _position(self, start, keyframe):
+        """Make the next _pull() return the frame at pts start
+
+        Reading on from the previous call needs no seek at all, e.g. the
+        next GOP of a get_range().
+        """
+        if self._pipeline is None:
+            self._start()
+        elif self._next_pts == start:
+            return
+        self._pending = None
+        self._pipeline.seek_simple(Gst.Format.TIME, Gst.SeekFlags.FLUSH | Gst.SeekFlags.KEY_UNIT, keyframe)
+        while True:
+            item = self._pull()
+            if item is None or item[0] >= start:
+                self._pending = item
+                self._next_pts = None if item is None else item[0]
+                return
+
+    def _pull(self):
+        """Next decoded (pts, frame), None at the end of the file"""
+        if self._pending is not None:
+            item, self._pending = self._pending, None
+        else:
+            sample = self._sink.try_pull_sample(5 * Gst.SECOND)
+            if sample is None:
+                self._next_pts = None
+                return None
+            item = sample.get_buffer().pts, Video.gst_to_opencv(sample)
+        i = bisect.bisect_right(self.frames, item[0])
+        self._next_pts = self.frames[i] if i < len(self.frames) else None
+        return item
+
+    def close(self):
+        if self._pipeline is not None:
+            self._pipeline.set_state(Gst.State.NULL)
+            self._pipeline = None
+        self._cache.clear()
+        self._cached_bytes = 0
+
+
+if __name__ == '__main__':
+    start = time.perf_counter()
+    index = KeyframeIndex(sys.argv[1])
+    print('{} frames, {} keyframes, index in {:.1f} ms'.format(
+        len(index.frames), len(index.keyframes), (time.perf_counter() - start) * 1e3))
+    duration = index.frames[-1] / Gst.SECOND if index.frames else 0
+    jumps = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    times = []
+    for _ in range(jumps):
+        t = random.uniform(0, duration)
+        start = time.perf_counter()
+        pts, frame = index.get_frame(t)
+        times.append(time.perf_counter() - start)
+        print('{:8.3f} s -> frame at {:8.3f} s in {:6.1f} ms'.format(t, pts / Gst.SECOND, times[-1] * 1e3))
+    if times:
+        print('median jump {:.1f} ms'.format(sorted(times)[len(times) // 2] * 1e3))
+    index.close()
@@ -0,0 +1,286 @@
+"""Prometheus text endpoint for the capture and streaming pipelines
+
+Most values are read through callbacks when /metrics is scraped, e.g. the
+frame counters Video keeps anyway, so nothing runs per frame unless a
+histogram or pad probe is attached.
+
+    registry = Registry()
+    watch_manager(registry, manager)
+    MetricsServer(registry, port=9108).start()
+"""
+
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('"', '\\"')) for k, v in pairs) + '}'
+
+
+class Metric():
+    """Counter or gauge, one value per label set
+
+    Values are plain numbers or callables evaluated at scrape time.
+
+    Attributes:
+        help (string): Description shown in the exposition
+        kind (string): 'counter' or 'gauge'
+        labelnames (tuple): Label names, values are given in the same order
+        name (string): Metric name
+    """
+
+    def __init__(self, name, help, kind, labelnames=()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def set_function(self, fn, **labels):
+        """Read the value from fn() whenever the metric is scraped"""
+        self._values[self._key(labels)] = fn
+
+    def remove(self, **labels):
+        self._values.pop(self._key(labels), None)
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help),
+                 '# TYPE {} {}'.format(self.name, self.kind)]
+        for key, value in list(self._values.items()):
+            if callable(value):
+                value = value()
+            lines.append('{}{} {}'.format(self.name, _format_labels(self.labelnames, key), value))
+        return lines
+
+
+class HistogramChild():
+    """Buckets of one label set, observe() is the per-event fast path"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        """Context manager observing the seconds its block takes"""
+        return _Timer(self)
+
+
+class _Timer():
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.child.observe(time.perf_counter() - self.start)
+
+
+class Histogram():
+    """Cumulative histogram, one HistogramChild per label set
+
+    Attributes:
+        buckets (tuple): Upper bounds, +Inf is implied
+    """
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = HistogramChild(self.buckets)
+        return child
+
+    def observe(self, value, **labels):
+        self.labels(**labels).observe(value)
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help),
+                 '# TYPE {} histogram'.format(self.name)]
+        for key, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), child.counts):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(
+                    self.name, _format_labels(self.labelnames, key, [('le', bound)]), cumulative))
+            labels = _format_labels(self.labelnames, key)
+            lines.append('{}_sum{} {}'.format(self.name, labels, child.sum))
+            lines.append('{}_count{} {}'.format(self.name, labels, child.count))
+        return lines
+
+
+class Registry():
+    """Named metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _add(self, metric):
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Metric(name, help, 'counter', labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self._add(Metric(name, help, 'gauge', labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer():
+    """Serves a registry on http://host:port/metrics from a daemon thread"""
+
+    def __init__(self, registry, port=9108, host='0.0.0.0'):
+        self.registry = registry
+        registry_ = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry_.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def watch_video(registry, video, camera_id):
+    """Export the counters of a vid.Video
+
+    Frames in/out, drops and queue depth are read at scrape time. Capture
+    to consumer latency is observed by Video.pop() once this is set up.
+    """
+    labels = {'camera': camera_id}
+    registry.counter('capture_frames_in_total', 'Frames received from appsink',
+                     ['camera']).set_function(lambda: video.frames, **labels)
+    registry.counter('capture_frames_out_total', 'Frames handed to consumers',
+                     ['camera']).set_function(lambda: video.delivered, **labels)
+    registry.counter('capture_frames_dropped_total', 'Frames dropped because the consumer fell behind',
+                     ['camera']).set_function(lambda: video.dropped, **labels)
+    registry.gauge('capture_queue_depth', 'Frames waiting to be read',
+                   ['camera']).set_function(lambda: video.queued, **labels)
+    video.latency = registry.histogram(
+        'capture_latency_seconds', 'Capture pts to consumer read',
+        ['camera']).labels(**labels)
+
+
+def watch_manager(registry, manager):
+    """Export every camera of a CaptureManager, see watch_video()"""
+    for camera_id, video in manager.cameras.items():
+        watch_video(registry, video, camera_id)
+
+
+def watch_encoder(registry, element, name=None):
+    """Count the bytes an encoder pushes, rate() of the counter is the bitrate
+
+    Args:
+        registry (Registry): Registry to add to
+        element (Gst.Element): Encoder, e.g. x264enc
+        name (string, optional): Label, defaults to the element name
+    """
+    name = name or element.get_name()
+    counter = registry.counter('encoder_bytes_total', 'Bytes out of the encoder', ['encoder'])
+    counter.set(0, encoder=name)
+    buffers = registry.counter('encoder_buffers_total', 'Buffers out of the encoder', ['encoder'])
+    buffers.set(0, encoder=name)
+
+    def on_buffer(pad, info):
+        counter.inc(info.get_buffer().get_size(), encoder=name)
+        buffers.inc(encoder=name)
+        return Gst.PadProbeReturn.OK
+
+    element.get_static_pad('src').add_probe(Gst.PadProbeType.BUFFER, on_buffer)
+
+
+def watch_hlssink(registry, pipeline):
+    """Time hlssink2 segment writes from its splitmuxsink fragment messages
+
+    The write time is how long after the segment's last buffer (the
+    message's running-time) the fragment got closed on disk.
+    """
+    histogram = registry.histogram(
+        'hls_segment_write_seconds', 'Time to finish writing an HLS segment', ['sink'])
+    segments = registry.counter('hls_segments_total', 'HLS segments written', ['sink'])
+
+    def on_message(bus, message):
+        structure = message.get_structure()
+        if structure is None or structure.get_name() != 'splitmuxsink-fragment-closed':
+            return
+        clock = pipeline.get_clock()
+        if clock is None:
+            return
+        now = clock.get_time() - pipeline.get_base_time()
+        running_time = structure.get_value('running-time')
+        sink = message.src.get_name()
+        histogram.observe(max(now - running_time, 0) / Gst.SECOND, sink=sink)
+        segments.inc(sink=sink)
+
+    bus = pipeline.get_bus()
+    bus.enable_sync_message_emission()
+    bus.connect('sync-message::element', on_message)
@@ -0,0 +1,230 @@
+"""Pipeline descriptions for vid.Video and the capture manager
+
+Every builder returns a description list ending in an appsink named 'sink',
+the same shape Video.start_gst() takes.
+
+All builders take the same optional reduction stage, applied inside
+GStreamer so Python only pays for the pixels it uses:
+    rate: deliver at most this many frames per second (videorate)
+    crop: [left, top, right, bottom] pixels removed from the edges (videocrop)
+    scale: [width, height] after cropping (videoscale)
+Frames are dropped before any conversion, and cropping and scaling happen
+before the colour conversion.
+
+They also take the raw format the consumer wants, negotiated in caps and
+converted exactly once: 'BGR' (default), 'BGRx' (vid.Video hands it out as
+a strided 3 channel view), 'GRAY8' or 'I420' (planes).
+"""
+
+import json
+
+APPSINK = '! appsink name=sink emit-signals=true sync={} max-buffers=2 drop=true'
+
+FORMATS = ('BGR', 'BGRx', 'GRAY8', 'I420')
+
+
+def decimate(rate=None):
+    """Frame dropping stage
+
+    Args:
+        rate (int, optional): Maximum frames per second, None keeps every frame
+
+    Returns:
+        list: Pipeline description list
+    """
+    if not rate:
+        return []
+    return ['! videorate drop-only=true max-rate={}'.format(rate)]
+
+
+def roi(crop=None, scale=None):
+    """Cropping and scaling stage
+
+    Args:
+        crop (list, optional): [left, top, right, bottom] pixels to remove
+        scale (list, optional): [width, height] of the output
+
+    Returns:
+        list: Pipeline description list
+    """
+    config = []
+    if crop:
+        config.append('! videocrop left={} top={} right={} bottom={}'.format(*crop))
+    if scale:
+        config.append('! videoscale ! video/x-raw, width={}, height={}'.format(*scale))
+    return config
+
+
+def convert(format='BGR'):
+    """Single colour conversion to the requested format
+
+    videoconvert is passthrough when upstream already negotiated the format.
+
+    Args:
+        format (string, optional): One of FORMATS
+
+    Returns:
+        list: Pipeline description list
+    """
+    if format not in FORMATS:
+        raise ValueError('Unsupported format: {}'.format(format))
+    return ['! videoconvert ! video/x-raw, format={}'.format(format)]
+
+
+def camset(sensor_id=0, width=1280, height=720, flip=0, framerate=21, balance=False,
+           rate=None, crop=None, scale=None, format='BGR'):
+    """CSI camera through nvarguscamerasrc, as in Opencv-1.py/Opencv-3.py
+
+    Args:
+        sensor_id (int, optional): Camera sensor id
+        width (int, optional): Output width
+        height (int, optional): Output height
+        flip (int, optional): nvvidconv flip-method
+        framerate (int, optional): Sensor framerate
+        balance (bool, optional): Add the videobalance used in Opencv-3.py,
+            not available with GRAY8
+        rate (int, optional): See module docstring
+        crop (list, optional): See module docstring
+        scale (list, optional): See module docstring
+        format (string, optional): See module docstring
+
+    Returns:
+        list: Pipeline description list
+    """
+    config = [
+        'nvarguscamerasrc sensor-id={}'.format(sensor_id),
+        '! video/x-raw(memory:NVMM), width=3264, height=2464, framerate={}/1,format=NV12'.format(framerate),
+    ]
+    # drop frames while they are still in NVMM memory, before nvvidconv
+    config += decimate(rate)
+    # nvvidconv outputs BGRx, GRAY8 and I420 itself, only BGR needs videoconvert
+    if format not in FORMATS:
+        raise ValueError('Unsupported format: {}'.format(format))
+    config += [
+        '! nvvidconv flip-method={}'.format(flip),
+        '! video/x-raw, width={}, height={}, format={}'.format(
+            width, height, 'BGRx' if format == 'BGR' else format),
+    ]
+    if balance:
+        config.append('! videobalance contrast=1.3 brightness=-.2 saturation=1.2')
+    config += roi(crop, scale)
+    if format == 'BGR':
+        config += convert(format)
+    config.append(APPSINK.format('false'))
+    return config
+
+
+def udp(port=5600, rate=None, crop=None, scale=None, format='BGR'):
+    """RTP/H264 stream on a UDP port, as in vid.Video
+
+    Args:
+        port (int, optional): UDP port
+        rate (int, optional): See module docstring
+        crop (list, optional): See module docstring
+        scale (list, optional): See module docstring
+        format (string, optional): See module docstring
+
+    Returns:
+        list: Pipeline description list
+    """
+    config = [
+        'udpsrc port={}'.format(port),
+        '! application/x-rtp, payload=96 ! rtph264depay ! h264parse ! avdec_h264',
+    ]
+    config += decimate(rate)
+    config += roi(crop, scale)
+    config += convert(format)
+    config.append(APPSINK.format('false'))
+    return config
+
+
+def testsrc(pattern=0, width=1280, height=720, framerate=21, rate=None, crop=None, scale=None,
+            format='BGR'):
+    """Live videotestsrc stand-in for a camera
+
+    Args:
+        pattern (int, optional): videotestsrc pattern
+        width (int, optional): Output width
+        height (int, optional): Output height
+        framerate (int, optional): Output framerate
+        rate (int, optional): See module docstring
+        crop (list, optional): See module docstring
+        scale (list, optional): See module docstring
+        format (string, optional): See module docstring
+
+    Returns:
+        list: Pipeline description list
+    """
+    config = [
+        'videotestsrc is-live=true pattern={}'.format(pattern),
+        # NV12 like the camera, so every format costs one real conversion
+        '! video/x-raw, format=NV12, width={}, height={}, framerate={}/1'.format(width, height, framerate),
+    ]
+    config += decimate(rate)
+    config += roi(crop, scale)
+    config += convert(format)
+    config.append(APPSINK.format('false'))
+    return config
+
+
+def filesrc(path, sync=True, rate=None, crop=None, scale=None, format='BGR'):
+    """Recorded file stand-in for a camera
+
+    Args:
+        path (string): Video file
+        sync (bool, optional): Play at the file rate instead of as fast as possible
+        rate (int, optional): See module docstring
+        crop (list, optional): See module docstring
+        scale (list, optional): See module docstring
+        format (string, optional): See module docstring
+
+    Returns:
+        list: Pipeline description list
+    """
+    config = [
+        'filesrc location="{}"'.format(path),
+        '! decodebin',
+    ]
+    config += decimate(rate)
+    config += roi(crop, scale)
+    config += convert(format)
+    config.append(APPSINK.format('true' if sync else 'false'))
+    return config
+
+
+BUILDERS = {
+    'camset': camset,
+    'udp': udp,
+    'testsrc': testsrc,
+    'filesrc': filesrc,
+}
+
+
+def load(path):
+    """Build pipelines for every camera of a JSON config file
+
+    The file maps camera ids to a builder name and its arguments, e.g.
+
+        {
+            "north": {"source": "camset", "sensor_id": 0, "flip": 2,
+                      "rate": 5, "crop": [0, 360, 0, 0], "scale": [640, 180]},
+            "test": {"source": "testsrc", "pattern": 18}
+        }
+
+    Args:
+        path (string): Config file
+
+    Returns:
+        dict: Camera id to pipeline description list, as CaptureManager takes
+    """
+    with open(path) as f:
+        cameras = json.load(f)
+
+    configs = {}
+    for camera_id, options in cameras.items():
+        options = dict(options)
+        source = options.pop('source', 'camset')
+        if source not in BUILDERS:
+            raise ValueError('Unknown source {!r} for camera {!r}'.format(source, camera_id))
+        configs[camera_id] = BUILDERS[source](**options)
+    return configs
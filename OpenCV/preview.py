@@ -0,0 +1,96 @@
+"""Low rate, downscaled preview in place of per-frame cv2.imshow
+
+The capture scripts showed every frame and slept in cv2.waitKey(1) on every
+iteration. A Preview only renders when a frame is due, so everything else
+runs at the source rate:
+
+    preview = Preview(fps=2, scale=0.5)
+    for frame in video:
+        if not preview.show('cam', frame.data):
+            break
+
+With a directory set nothing touches the GUI: the preview frame is written
+to <directory>/<name>.jpg instead (see file_name()), for units without a monitor.
+"""
+
+import os
+import time
+
+import cv2
+
+
+def file_name(name):
+    """File name of the preview of a stream named name
+
+    Stream names can be paths (run.py names file sources by their
+    argument); separators become '_' so the JPEG stays in the directory,
+    and leading dots go so it can't be '..' or hidden.
+    """
+    name = str(name)
+    for sep in (os.sep, os.altsep):
+        if sep:
+            name = name.replace(sep, '_')
+    return (name.lstrip('._') or 'preview') + '.jpg'
+
+
+class Preview():
+    """Rate limited preview of one or more named streams
+
+    Attributes:
+        directory (string): Where headless previews go, None shows windows
+        fps (float): Previews per second per stream, None shows every frame
+        scale (float): Preview size relative to the frame
+    """
+
+    def __init__(self, fps=2.0, scale=0.5, directory=None):
+        """Summary
+
+        Args:
+            fps (float, optional): Previews per second per stream, None for every frame
+            scale (float, optional): Preview size relative to the frame
+            directory (string, optional): Write JPEGs here instead of showing windows
+        """
+        self.fps = fps
+        self.scale = scale
+        self.directory = directory
+        self._due = {}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def due(self, name):
+        """Check if the next frame of name would be rendered"""
+        return not self.fps or time.monotonic() >= self._due.get(name, 0)
+
+    def show(self, name, frame):
+        """Render frame if a preview of name is due
+
+        Frames in between cost one clock read.
+
+        Args:
+            name (string): Window or file name
+            frame (np.ndarray): Frame, or a tuple of planes (the first is shown)
+
+        Returns:
+            bool: False once 'q' was pressed in a preview window
+        """
+        if not self.due(name):
+            return True
+        if self.fps:
+            self._due[name] = time.monotonic() + 1.0 / self.fps
+        if isinstance(frame, tuple):
+            frame = frame[0]
+        if self.scale != 1:
+            frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+
+        if self.directory:
+            path = os.path.join(self.directory, file_name(name))
+            # write next to it and rename, so readers never see half a file
+            cv2.imwrite(path + '.tmp.jpg', frame)
+            os.replace(path + '.tmp.jpg', path)
+            return True
+        cv2.imshow(name, frame)
+        return cv2.waitKey(1) & 0xFF != ord('q')
+
+    def close(self):
+        if not self.directory:
+            cv2.destroyAllWindows()
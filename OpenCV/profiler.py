@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# Per-element profiling of any Gst.parse_launch pipeline with pad probes.
+#
+# usage: python profiler.py "<pipeline description>" [interval-seconds] [report.json|report.csv]
+#   e.g. python profiler.py "videotestsrc num-buffers=300 ! videoconvert ! clockoverlay ! x264enc ! fakesink"
+
+import csv
+import json
+import os
+import sys
+import threading
+import time
+
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+# arrivals remembered per element while waiting for the buffer to leave it
+MAX_IN_FLIGHT = 256
+
+
+class ElementStats():
+    """Counters of one element, reset by PipelineProfiler.report()
+
+    Attributes:
+        buffers (int): Buffers pushed out of the element's src pads
+        latency_max (int): Slowest sink-to-src time in ns
+        latency_sum (int): Sum of sink-to-src times in ns
+        latency_count (int): Buffers latency_sum covers
+        latency_total (int): Sum of sink-to-src times in ns since start, not reset
+        path (string): Element path from the pipeline, ';' separated
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.buffers = 0
+        self.latency_sum = 0
+        self.latency_count = 0
+        self.latency_max = 0
+        self.latency_total = 0
+        self.arrivals = {}
+
+
+class PipelineProfiler():
+    """Attaches BUFFER probes to every element of a pipeline
+
+    A probe on each sink pad stamps when a buffer (matched by pts) enters
+    the element and a probe on each src pad when it leaves, which gives the
+    per-element latency and buffer rate. queue elements also report their
+    fill level. Elements added later, e.g. by decodebin, are picked up too.
+
+    Attributes:
+        pipeline (Gst.Pipeline): Profiled pipeline
+    """
+
+    def __init__(self, pipeline):
+        """Summary
+
+        Args:
+            pipeline (Gst.Pipeline): Pipeline to profile, any state
+        """
+        self.pipeline = pipeline
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._since = time.monotonic()
+        self._timer = None
+
+        pipeline.connect('deep-element-added', self._on_element_added)
+        for element in self._elements(pipeline):
+            self._attach(element)
+
+    @staticmethod
+    def _elements(bin):
+        elements = []
+        iterator = bin.iterate_recurse()
+        while True:
+            result, element = iterator.next()
+            if result != Gst.IteratorResult.OK:
+                break
+            elements.append(element)
+        return elements
+
+    @staticmethod
+    def _path(element):
+        names = []
+        while element is not None:
+            names.append(element.get_name())
+            element = element.get_parent()
+        return ';'.join(reversed(names))
+
+    def _on_element_added(self, pipeline, bin, element):
+        self._attach(element)
+
+    def _attach(self, element):
+        # bins only forward through ghost pads, their children are profiled
+        if isinstance(element, Gst.Bin):
+            return
+        with self._lock:
+            if element in self._stats:
+                return
+            self._stats[element] = ElementStats(self._path(element))
+        for pad in element.pads:
+            self._probe(element, pad)
+        element.connect('pad-added', lambda element, pad: self._probe(element, pad))
+
+    def _probe(self, element, pad):
+        stats = self._stats[element]
+        types = Gst.PadProbeType.BUFFER | Gst.PadProbeType.BUFFER_LIST
+        if pad.get_direction() == Gst.PadDirection.SINK:
+            pad.add_probe(types, self._on_sink_buffer, stats)
+        else:
+            pad.add_probe(types, self._on_src_buffer, stats)
+
+    @staticmethod
+    def _info_buffer(info):
+        if info.type & Gst.PadProbeType.BUFFER_LIST:
+            buffers = info.get_buffer_list()
+            return buffers.get(0) if buffers.length() else None, buffers.length()
+        return info.get_buffer(), 1
+
+    def _on_sink_buffer(self, pad, info, stats):
+        buf, _ = self._info_buffer(info)
+        if buf is not None and buf.pts != Gst.CLOCK_TIME_NONE:
+            now = time.perf_counter_ns()
+            with self._lock:
+                if len(stats.arrivals) >= MAX_IN_FLIGHT:
+                    del stats.arrivals[next(iter(stats.arrivals))]
+                stats.arrivals[buf.pts] = now
+        return Gst.PadProbeReturn.OK
+
+    def _on_src_buffer(self, pad, info, stats):
+        buf, count = self._info_buffer(info)
+        now = time.perf_counter_ns()
+        with self._lock:
+            stats.buffers += count
+            arrived = stats.arrivals.pop(buf.pts, None) if buf is not None else None
+            if arrived is not None:
+                latency = now - arrived
+                stats.latency_sum += latency
+                stats.latency_total += latency
+                stats.latency_count += 1
+                stats.latency_max = max(stats.latency_max, latency)
+        return Gst.PadProbeReturn.OK
+
+    @staticmethod
+    def _queue_fill(element):
+        factory = element.get_factory()
+        if factory is None or factory.get_name() not in ('queue', 'queue2'):
+            return None
+        level = element.get_property('current-level-buffers')
+        limit = element.get_property('max-size-buffers')
+        return level / limit if limit else float(level)
+
+    def report(self):
+        """Per element numbers since the previous report
+
+        Returns:
+            list: One dict per element with element, path, fps, latency_ms,
+                latency_max_ms and queue_fill (None for non-queues)
+        """
+        now = time.monotonic()
+        elapsed = max(now - self._since, 1e-9)
+        self._since = now
+        rows = []
+        with self._lock:
+            for element, stats in self._stats.items():
+                rows.append({
+                    'element': element.get_name(),
+                    'path': stats.path,
+                    'fps': stats.buffers / elapsed,
+                    'latency_ms': (stats.latency_sum / stats.latency_count / 1e6
+                                   if stats.latency_count else None),
+                    'latency_max_ms': stats.latency_max / 1e6,
+                    'queue_fill': self._queue_fill(element),
+                })
+                stats.buffers = stats.latency_sum = stats.latency_count = stats.latency_max = 0
+        return rows
+
+    def folded(self):
+        """Flame graph summary of the total time spent in each element
+
+        Returns:
+            list: 'pipeline;bin;element microseconds' lines, the folded stack
+                format flamegraph.pl and speedscope read
+        """
+        with self._lock:
+            return ['{} {}'.format(stats.path, stats.latency_total // 1000)
+                    for stats in self._stats.values() if stats.latency_total]
+
+    def write(self, path):
+        """Append a report to a .json (one object per line) or .csv file
+
+        Args:
+            path (string): Report file
+        """
+        rows = self.report()
+        timestamp = time.time()
+        if path.endswith('.csv'):
+            new = not os.path.exists(path)
+            with open(path, 'a', newline='') as f:
+                writer = csv.DictWriter(f, ['time'] + list(rows[0]) if rows else ['time'])
+                if new:
+                    writer.writeheader()
+                for row in rows:
+                    writer.writerow(dict(row, time=timestamp))
+        else:
+            with open(path, 'a') as f:
+                f.write(json.dumps({'time': timestamp, 'elements': rows}) + '\n')
+
+    def start(self, path, interval=5.0):
+        """Write a report every interval seconds until stop()
+
+        Args:
+            path (string): Report file, see write()
+            interval (float, optional): Seconds between reports
+        """
+        def tick():
+            self.write(path)
+            self._timer = threading.Timer(interval, tick)
+            self._timer.daemon = True
+            self._timer.start()
+
+        self._timer = threading.Timer(interval, tick)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+
+def print_report(rows):
+    print('{:24} {:>8} {:>12} {:>12} {:>6}'.format('element', 'fps', 'latency ms', 'max ms', 'queue'))
+    for row in sorted(rows, key=lambda row: -(row['latency_ms'] or 0)):
+        print('{:24} {:8.1f} {:>12} {:12.2f} {:>6}'.format(
+            row['element'], row['fps'],
+            '-' if row['latency_ms'] is None else '{:.2f}'.format(row['latency_ms']),
+            row['latency_max_ms'],
+            '-' if row['queue_fill'] is None else '{:.0%}'.format(row['queue_fill'])))
+
+
+if __name__ == '__main__':
+    Gst.init(None)
+    pipeline = Gst.parse_launch(sys.argv[1])
+    interval = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    profiler = PipelineProfiler(pipeline)
+    if len(sys.argv) > 3:
+        profiler.start(sys.argv[3], interval)
+
+    pipeline.set_state(Gst.State.PLAYING)
+    try:
+        while True:
+            msg = pipeline.get_bus().timed_pop_filtered(
+                int(interval * Gst.SECOND),
+                Gst.MessageType.EOS | Gst.MessageType.ERROR
+            )
+            if msg:
+                break
+            if len(sys.argv) <= 3:
+                print_report(profiler.report())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        profiler.stop()
+        pipeline.set_state(Gst.State.NULL)
+        print('\n'.join(profiler.folded()))
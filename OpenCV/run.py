@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# One capture loop for every camera script, with or without a monitor.
+#
+# usage: python run.py [options] [csi[:sensor] | udp[:port] | test | cameras.json | video files...]
+#
+#   --headless      no GUI calls at all, the loop runs at the source rate
+#   --preview=FPS   downscaled preview at FPS instead of full rate display,
+#                   written to preview/<camera>.jpg when headless
+#   --scale=F       preview size relative to the frame (default 0.5)
+#   --format=F      BGR, BGRx, GRAY8 or I420, see pipelines.py
+#   --flip=N        nvvidconv flip-method of the CSI camera
+#   --balance       videobalance of Opencv-3.py on the CSI camera
+#
+# The old scripts map to:
+#   Opencv-1.py     python run.py --flip=1 csi
+#   Opencv-3.py     python run.py --flip=2 --balance csi
+#   Opencv-read.py  python run.py --format=GRAY8 v2.mp4
+#   vid.py          python run.py udp:5600
+
+import sys
+import time
+
+import pipelines
+from capture import CaptureManager
+from preview import Preview
+
+
+def configs_for(args, format='BGR', flip=0, balance=False):
+    """Camera id to pipeline description list for the command line sources"""
+    args = args or ['csi']
+    if args[0].endswith('.json'):
+        return pipelines.load(args[0])
+    configs = {}
+    for arg in args:
+        kind, _, value = arg.partition(':')
+        if kind == 'csi':
+            configs[arg] = pipelines.camset(sensor_id=int(value or 0), flip=flip, balance=balance,
+                                            format=format)
+        elif kind == 'udp':
+            configs[arg] = pipelines.udp(port=int(value or 5600), format=format)
+        elif kind == 'test':
+            configs[arg] = pipelines.testsrc(pattern=int(value or 0), format=format)
+        else:
+            configs[arg] = pipelines.filesrc(arg, format=format)
+    return configs
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    headless = False
+    fps = None
+    scale = None
+    options = {}
+    while args and args[0].startswith('--'):
+        flag, _, value = args.pop(0).partition('=')
+        if flag == '--headless':
+            headless = True
+        elif flag == '--preview':
+            fps = float(value or 2)
+        elif flag == '--scale':
+            scale = float(value)
+        elif flag == '--format':
+            options['format'] = value
+        elif flag == '--flip':
+            options['flip'] = int(value)
+        elif flag == '--balance':
+            options['balance'] = True
+        else:
+            sys.exit('unknown option ' + flag)
+
+    if fps:
+        preview = Preview(fps, 0.5 if scale is None else scale, 'preview' if headless else None)
+    elif not headless:
+        # the old behaviour, every frame at full size
+        preview = Preview(None, 1.0 if scale is None else scale)
+    else:
+        preview = None
+
+    manager = CaptureManager(configs_for(args, **options))
+    next_report = time.monotonic() + 5
+    try:
+        for camera_id, pts, frame in manager:
+            if preview is not None and not preview.show(str(camera_id), frame):
+                break
+            if headless and time.monotonic() >= next_report:
+                next_report += 5
+                for name, stats in manager.stats().items():
+                    print('{}: {fps:5.1f} fps, {frames} frames, {dropped} dropped'.format(name, **stats))
+    except KeyboardInterrupt:
+        pass
+
+    manager.stop()
+    if preview is not None:
+        preview.close()
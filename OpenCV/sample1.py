@@ -3,6 +3,8 @@ import gi
 gi.require_version('Gst', '1.0')
 from gi.repository import Gst
 
+from profiler import PipelineProfiler, print_report
+
 frame_format = 'RGBA'
 
 Gst.init()
@@ -12,15 +14,9 @@ pipeline = Gst.parse_launch(f'''
     fakesink name=dk
 ''')
 
-def on_frame_probe(pad, info):
-    buf = info.get_buffer()
-    print(f'[{buf.pts / Gst.SECOND:6.2f}]')
-    return Gst.PadProbeReturn.OK
-
-pipeline.get_by_name('dk').get_static_pad('sink').add_probe(
-    Gst.PadProbeType.BUFFER,
-    on_frame_probe
-)
+# probes on every element instead of just fakesink, see profiler.py
+profiler = PipelineProfiler(pipeline)
+log_name = f'logs/{os.path.splitext(sys.argv[0])[0]}'
 
 pipeline.set_state(Gst.State.PLAYING)
 
@@ -36,7 +32,9 @@ try:
             print(f'{msg.src.name}: [{msg_type}] {text}')
             break
 finally:
-    open(f'logs/{os.path.splitext(sys.argv[0])[0]}.pipeline.dot', 'w').write(
+    open(f'{log_name}.pipeline.dot', 'w').write(
         Gst.debug_bin_to_dot_data(pipeline, Gst.DebugGraphDetails.ALL)
     )
-    pipeline.set_state(Gst.State.NULL)
\ No newline at end of file
+    pipeline.set_state(Gst.State.NULL)
+    open(f'{log_name}.folded', 'w').write('\n'.join(profiler.folded()) + '\n')
+    print_report(profiler.report())
\ No newline at end of file
@@ -8,6 +8,8 @@ gi.require_version("GstApp", "1.0")
 
 from gi.repository import Gst, GstApp, GLib
 
+import metrics
+
 _= GstApp
 
 Gst.init()
@@ -20,6 +22,13 @@ main_loop_thread.start()
 # pipeline = Gst.parse_launch("v4l2src ! decodebin ! videoconvert ! autovideosink")
 pipeline = Gst.parse_launch("nvarguscamerasrc sensor-id=0 ! video/x-raw(memory:NVMM), framerate=21/1,format=NV12 ! video/x-raw, width='+str(width)+', height='+str(height)+', format=BGRx ! videoconvert ! video/x-raw, format=BGR ! appsink name=dk")
 appsink = pipeline.get_by_name("dk")
+
+# samples are counted on http://localhost:9108/metrics instead of printed
+registry = metrics.Registry()
+samples = registry.counter("appsink_samples_total", "Samples pulled from appsink")
+samples.set(0)
+metrics.MetricsServer(registry, 9108).start()
+
 pipeline.set_state(Gst.State.PLAYING)
 
 try:
@@ -28,7 +37,7 @@ try:
         if sample is None:
             continue
     
-        print("Got a sample!")
+        samples.inc()
 except KeyboardInterrupt:
     pass
 
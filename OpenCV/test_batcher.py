@@ -0,0 +1,17 @@
+import cv2
+import numpy as np
+import pytest
+
+from batcher import resize
+
+
+@pytest.mark.parametrize('interpolation', [cv2.INTER_AREA, cv2.INTER_LINEAR, cv2.INTER_NEAREST,
+                                           cv2.INTER_NEAREST_EXACT, cv2.INTER_CUBIC])
+@pytest.mark.parametrize('shape', [(2, 360, 640, 3), (8, 180, 320), (5, 361, 643, 3)])
+@pytest.mark.parametrize('size', [(224, 224), (320, 180), (160, 90), (1280, 720)])
+def test_resize_matches_per_frame(interpolation, shape, size):
+    frames = np.random.default_rng(0).integers(0, 256, shape, dtype=np.uint8)
+    expected = np.stack([cv2.resize(frame, size, interpolation=interpolation) for frame in frames])
+    out = resize(frames, size[0], size[1], interpolation)
+    assert out.shape == expected.shape
+    assert np.array_equal(out, expected)
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+from counter import LineCounter
+
+LINE = {'lane': [0, 340, 640, 340]}
+
+
+def drive(top, dy, frames=30):
+    """Crossings of a 40 px tall box starting at y=top, dy px per frame"""
+    counter = LineCounter(LINE)
+    crossings = []
+    for i in range(frames):
+        box = np.array([[300, top + dy * i, 60, 40]])
+        crossings += counter.update(i * 40 * 10**6, box)[0]
+    return crossings
+
+
+@pytest.mark.parametrize('top, dy', [(300, 4), (302, 4), (380, -4), (382, -4)])
+def test_crossing_counted_once(top, dy):
+    # top=300 and top=380 put the centroid exactly on the line on the way
+    crossings = drive(top, dy)
+    assert len(crossings) == 1
+    assert crossings[0].direction == (1 if dy > 0 else -1) * drive(302, 4)[0].direction
@@ -0,0 +1,21 @@
+import numpy as np
+
+from workers import WorkerPool
+
+
+def frame_sum(frame):
+    return frame.shape, int(frame.sum(dtype=np.int64))
+
+
+def test_mixed_frame_sizes():
+    # the sizes of the cameras in cameras.json, smallest first
+    shapes = [(180, 640, 3), (720, 1280, 3), (360, 640, 3)]
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, shapes[i % 3], dtype=np.uint8) for i in range(12)]
+    with WorkerPool(frame_sum, workers=2, slots=2) as pool:
+        for i, frame in enumerate(frames):
+            assert pool.submit('cam%d' % (i % 3), i, frame) == i
+        results = [pool.get(10) for _ in frames]
+    assert [result.pts for result in results] == list(range(12))
+    for result, frame in zip(results, frames):
+        assert result.value == (frame.shape, int(frame.sum(dtype=np.int64)))
@@ -1,18 +1,233 @@
 #!/usr/bin/env python
 
+import collections
+import sys
+import threading
+
 import cv2
 import gi
 import numpy as np
 
 gi.require_version('Gst', '1.0')
-from gi.repository import Gst
+gi.require_version('GstVideo', '1.0')
+from gi.repository import Gst, GstVideo
+
+
+# Packed formats: (channels in the numpy view, bytes per pixel). BGRx and
+# RGBx are handed out as 3 channel views striding over the padding byte.
+PACKED_FORMATS = {
+    'BGR': (3, 3),
+    'RGB': (3, 3),
+    'BGRx': (3, 4),
+    'RGBx': (3, 4),
+    'BGRA': (4, 4),
+    'RGBA': (4, 4),
+    'GRAY8': (1, 1),
+}
+# Planar formats: (horizontal, vertical) subsampling of every plane
+PLANAR_FORMATS = {
+    'I420': ((1, 1), (2, 2), (2, 2)),
+}
+
+_video_infos = {}
+
+
+def video_info(caps):
+    """Cached GstVideo.VideoInfo of raw video caps
+
+    Args:
+        caps (Gst.Caps): Negotiated caps
+
+    Returns:
+        GstVideo.VideoInfo: Default plane offsets and strides
+    """
+    key = caps.to_string()
+    info = _video_infos.get(key)
+    if info is None:
+        try:
+            info = GstVideo.VideoInfo.new_from_caps(caps)
+        except AttributeError:
+            info = GstVideo.VideoInfo()
+            info.from_caps(caps)
+        _video_infos[key] = info
+    return info
+
+
+def wrap_planes(data, layout):
+    """Wrap a buffer with np.ndarray views, one per plane
+
+    Args:
+        data (object): Object exposing the buffer protocol
+        layout (list): (offset, shape, strides) per plane, see Video.sample_layout()
+
+    Returns:
+        np.ndarray or tuple: Single view for packed formats, one per plane otherwise
+    """
+    planes = tuple(
+        np.ndarray(shape, buffer=data, dtype=np.uint8, offset=offset, strides=strides)
+        for offset, shape, strides in layout)
+    return planes[0] if len(planes) == 1 else planes
+
+
+def copy_planes(frame, pool):
+    """Copy a frame or tuple of planes into arrays taken from pool
+
+    Args:
+        frame (np.ndarray or tuple): Frame to copy
+        pool (FramePool): Pool to take the output arrays from
+
+    Returns:
+        np.ndarray or tuple: Contiguous copy with the same structure
+    """
+    if isinstance(frame, tuple):
+        return tuple(copy_planes(plane, pool) for plane in frame)
+    out = pool.acquire(frame.shape)
+    np.copyto(out, frame)
+    return out
+
+
+# seq: sequence number of the sample, pts: presentation time in ns,
+# data: frame (MappedFrame in 'map' mode), dropped: frames lost since the last read
+Frame = collections.namedtuple('Frame', ['seq', 'pts', 'data', 'dropped'])
+
+
+class FramePool():
+    """Recycled output arrays for callers that need to own frame data
+
+    Copying a mapped buffer into an array taken from the pool avoids a fresh
+    allocation per frame. Arrays are keyed by shape, give them back with
+    release() once they are no longer needed.
+
+    Attributes:
+        size (int): Maximum number of idle arrays kept per shape
+    """
+
+    def __init__(self, size=4):
+        """Summary
+
+        Args:
+            size (int, optional): Maximum number of idle arrays kept per shape
+        """
+        self.size = size
+        self._free = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, shape):
+        """Get an uninitialised uint8 array
+
+        Args:
+            shape (tuple): Array shape
+
+        Returns:
+            np.ndarray: Recycled array if one is idle, new one otherwise
+        """
+        with self._lock:
+            free = self._free.get(shape)
+            if free:
+                return free.pop()
+        return np.empty(shape, dtype=np.uint8)
+
+    def release(self, array):
+        """Give an array back to the pool
+
+        Args:
+            array (np.ndarray or tuple): Array previously returned by acquire(),
+                or a tuple of planes
+        """
+        if isinstance(array, tuple):
+            for plane in array:
+                self.release(plane)
+            return
+        with self._lock:
+            free = self._free.setdefault(array.shape, [])
+            if len(free) < self.size:
+                free.append(array)
+
+
+class MappedFrame():
+    """Read-only view of a Gst.Sample without copying it
+
+    The buffer stays mapped until release() is called, use it as a context
+    manager and do not keep `array` around afterwards:
+
+        with MappedFrame(sample) as frame:
+            cv2.imshow('frame', frame)
+
+    Attributes:
+        array (np.ndarray or tuple): Read-only view backed by the mapped
+            buffer, one view per plane for planar formats
+        sample (Gst.Sample): Sample keeping the buffer alive
+    """
+
+    def __init__(self, sample):
+        """Summary
+
+        Args:
+            sample (Gst.Sample): Sample pulled from appsink
+        """
+        self.sample = sample
+        self._buffer = sample.get_buffer()
+        success, self._map_info = self._buffer.map(Gst.MapFlags.READ)
+        if not success:
+            raise RuntimeError('Could not map buffer')
+
+        self.array = wrap_planes(self._map_info.data, Video.sample_layout(sample))
+
+    def copy(self, pool=None):
+        """Copy the view into an array owned by the caller
+
+        Args:
+            pool (FramePool, optional): Pool to take the output array from
+
+        Returns:
+            np.ndarray or tuple: Writable copy of the frame
+        """
+        return copy_planes(self.array, pool if pool is not None else FramePool(0))
+
+    def release(self):
+        """Unmap the buffer, `array` is no longer valid afterwards
+        """
+        if self._map_info is None:
+            return
+        self.array = None
+        self._buffer.unmap(self._map_info)
+        self._map_info = None
+
+    def __enter__(self):
+        return self.array
+
+    def __exit__(self, *args):
+        self.release()
 
 
 class Video():
     """BlueRov video capture class constructor
 
+    Frames are numpy views shaped after the negotiated caps format, e.g.
+    (H, W, 3) for BGR and BGRx, (H, W) for GRAY8 and a (Y, U, V) tuple of
+    planes for I420.
+
+    Frames can be delivered in three modes:
+        'copy': `extract_dup` into a new array per frame (default)
+        'map': keep the sample, frame() returns a MappedFrame view, no copy
+        'pool': map and copy into arrays recycled through a FramePool
+
+    Frames are queued by the appsink callback and handed out by read() or
+    by iterating over the Video, both block until a frame arrives. When the
+    consumer falls behind the oldest queued frames are dropped and reported
+    in Frame.dropped.
+
     Attributes:
+        dropped (int): Total frames dropped because the queue was full
+        mode (string): Frame delivery mode, 'copy', 'map' or 'pool'
+        config (list): Pipeline description list replacing the UDP source
+        delivered (int): Total frames handed out by read()/pop()
+        frames (int): Total frames received from appsink
+        latency (object): Optional histogram (see metrics.py) observing the
+            seconds from capture pts to pop(), None disables the measurement
+        pool (FramePool): Output arrays used in 'pool' mode
         port (int): Video UDP port
+        queue_size (int): Maximum number of frames waiting to be read
         video_codec (string): Source h264 parser
         video_decode (string): Transform YUV (12bits) to BGR (24bits)
         video_pipe (object): GStreamer top-level pipeline
@@ -21,17 +236,42 @@ class Video():
         video_source (string): Udp source ip and port
     """
 
-    def __init__(self, port=5600):
+    def __init__(self, port=5600, mode='copy', pool=None, queue_size=2,
+                 config=None, cond=None, format='BGR'):
         """Summary
 
         Args:
             port (int, optional): UDP port
+            mode (string, optional): Frame delivery mode
+            pool (FramePool, optional): Output arrays used in 'pool' mode
+            queue_size (int, optional): Maximum number of frames waiting to be read
+            config (list, optional): Pipeline description list, must end in
+                an appsink named 'sink' with emit-signals=true
+            cond (threading.Condition, optional): Condition shared with
+                other Videos, notified on every new frame
+            format (string, optional): Raw format of the UDP pipeline, one of
+                PACKED_FORMATS or PLANAR_FORMATS, ignored with config
         """
 
         Gst.init(None)
 
+        if mode not in ('copy', 'map', 'pool'):
+            raise ValueError('Unknown frame mode: {}'.format(mode))
+
         self.port = port
+        self.mode = mode
+        self.pool = pool if pool is not None else FramePool()
+        self.queue_size = queue_size
+        self.config = config
+        self.dropped = 0
+        self.frames = 0
+        self.delivered = 0
+        self.latency = None
         self._frame = None
+        self._frames = collections.deque()
+        self._cond = cond if cond is not None else threading.Condition()
+        self._last_seq = -1
+        self._stopped = False
 
         # [Software component diagram](https://www.ardusub.com/software/components.html)
         # UDP video stream (:5600)
@@ -40,11 +280,12 @@ class Video():
         # Cam -> CSI-2 -> H264 Raw (YUV 4-4-4 (12bits) I420)
         self.video_codec = '! application/x-rtp, payload=96 ! rtph264depay ! h264parse ! avdec_h264'
         # Python don't have nibble, convert YUV nibbles (4-4-4) to OpenCV standard BGR bytes (8-8-8)
+        # Convert once, straight to the format the consumer asked for
         self.video_decode = \
-            '! decodebin ! videoconvert ! video/x-raw,format=(string)BGR ! videoconvert'
+            '! decodebin ! videoconvert ! video/x-raw,format=(string){}'.format(format)
         # Create a sink to get data
         self.video_sink_conf = \
-            '! appsink emit-signals=true sync=false max-buffers=2 drop=true'
+            '! appsink name=sink emit-signals=true sync=false max-buffers=2 drop=true'
 
         self.video_pipe = None
         self.video_sink = None
@@ -57,7 +298,7 @@ class Video():
             [
                 'videotestsrc ! decodebin', \
                 '! videoconvert ! video/x-raw,format=(string)BGR ! videoconvert',
-                '! appsink'
+                '! appsink name=sink'
             ]
 
         Args:
@@ -69,43 +310,168 @@ class Video():
                 [
                     'videotestsrc ! decodebin',
                     '! videoconvert ! video/x-raw,format=(string)BGR ! videoconvert',
-                    '! appsink'
+                    '! appsink name=sink'
                 ]
 
         command = ' '.join(config)
         self.video_pipe = Gst.parse_launch(command)
+        bus = self.video_pipe.get_bus()
+        bus.enable_sync_message_emission()
+        bus.connect('sync-message', self.on_message)
         self.video_pipe.set_state(Gst.State.PLAYING)
-        self.video_sink = self.video_pipe.get_by_name('appsink0')
+        self.video_sink = self.video_pipe.get_by_name('sink')
+
+    @staticmethod
+    def sample_layout(sample):
+        """Plane offsets, shapes and strides of a raw video sample
+
+        Strides come from the buffer's GstVideoMeta when upstream set one,
+        from the caps otherwise, so padded rows are handled.
+
+        Args:
+            sample (Gst.Sample): Sample pulled from appsink
+
+        Returns:
+            list: (offset, shape, strides) per plane for np.ndarray
+        """
+        caps = sample.get_caps()
+        structure = caps.get_structure(0)
+        fmt = structure.get_value('format')
+        height = structure.get_value('height')
+        width = structure.get_value('width')
+
+        meta = GstVideo.buffer_get_video_meta(sample.get_buffer())
+        if meta is None:
+            meta = video_info(caps)
+        offsets, strides = meta.offset, meta.stride
+
+        if fmt in PACKED_FORMATS:
+            channels, pixel = PACKED_FORMATS[fmt]
+            if channels == 1:
+                return [(offsets[0], (height, width), (strides[0], 1))]
+            return [(offsets[0], (height, width, channels), (strides[0], pixel, 1))]
+
+        if fmt in PLANAR_FORMATS:
+            return [
+                (offsets[i], (-(-height // sy), -(-width // sx)), (strides[i], 1))
+                for i, (sx, sy) in enumerate(PLANAR_FORMATS[fmt])
+            ]
+
+        raise ValueError('Unsupported format: {}'.format(fmt))
 
     @staticmethod
     def gst_to_opencv(sample):
         """Transform byte array into np array
 
         Args:
-            sample (TYPE): Description
+            sample (Gst.Sample): Sample pulled from appsink
 
         Returns:
-            TYPE: Description
+            np.ndarray or tuple: Frame copied out of the buffer
         """
         buf = sample.get_buffer()
-        caps = sample.get_caps()
-        array = np.ndarray(
-            (
-                caps.get_structure(0).get_value('height'),
-                caps.get_structure(0).get_value('width'),
-                3
-            ),
-            buffer=buf.extract_dup(0, buf.get_size()), dtype=np.uint8)
-        return array
+        return wrap_planes(buf.extract_dup(0, buf.get_size()), Video.sample_layout(sample))
+
+    @staticmethod
+    def gst_to_pool(sample, pool):
+        """Copy a mapped sample into an array taken from pool
+
+        Args:
+            sample (Gst.Sample): Sample pulled from appsink
+            pool (FramePool): Pool to take the output array from
+
+        Returns:
+            np.ndarray or tuple: Frame owned by the caller, release() it to the pool
+        """
+        with MappedFrame(sample) as view:
+            return copy_planes(view, pool)
+
+    def read(self, timeout=None):
+        """Wait for the next frame
+
+        Args:
+            timeout (float, optional): Seconds to wait, None waits forever
+
+        Returns:
+            Frame: Next frame, None on timeout or once the stream has ended
+        """
+        with self._cond:
+            if not self._cond.wait_for(
+                    lambda: self._frames or self._stopped, timeout):
+                return None
+            if not self._frames:
+                return None
+            return self.pop()
+
+    def pending(self):
+        """Check if frames are queued, call with the condition held
+
+        Returns:
+            bool: true if pop() would return a frame
+        """
+        return len(self._frames) > 0
+
+    @property
+    def stopped(self):
+        return self._stopped
+
+    @property
+    def queued(self):
+        return len(self._frames)
+
+    def pop(self):
+        """Take the oldest queued frame, call with the condition held
+
+        Returns:
+            Frame: Oldest queued frame
+        """
+        frame = self._frames.popleft()
+        if self.mode == 'map':
+            frame = frame._replace(data=MappedFrame(frame.data))
+        frame = frame._replace(dropped=frame.seq - self._last_seq - 1)
+        self._last_seq = frame.seq
+        self.delivered += 1
+        if self.latency is not None and frame.pts != Gst.CLOCK_TIME_NONE:
+            clock = self.video_pipe.get_clock()
+            if clock is not None:
+                running_time = clock.get_time() - self.video_pipe.get_base_time()
+                self.latency.observe(max(running_time - frame.pts, 0) / Gst.SECOND)
+        return frame
+
+    def __iter__(self):
+        """Iterate over frames until the stream ends
+
+        Yields:
+            Frame: Next frame
+        """
+        while True:
+            frame = self.read()
+            if frame is None:
+                return
+            yield frame
 
     def frame(self):
         """ Get Frame
 
+        In 'map' mode a MappedFrame is returned, use it as a context manager
+        to get the read-only view.
+
         Returns:
-            iterable: bool and image frame, cap.read() output
+            np.ndarray or MappedFrame: Latest frame
         """
+        if self.mode == 'map':
+            return MappedFrame(self._frame)
         return self._frame
 
+    def release(self, frame):
+        """Give a frame returned in 'pool' mode back to the pool
+
+        Args:
+            frame (np.ndarray): Frame returned by frame()
+        """
+        if self.mode == 'pool':
+            self.pool.release(frame)
+
     def frame_available(self):
         """Check if frame is available
 
@@ -114,12 +480,33 @@ class Video():
         """
         return type(self._frame) != type(None)
 
+    def stop(self):
+        """Stop the pipeline and wake up blocked readers
+        """
+        if self.video_pipe is not None:
+            self.video_pipe.set_state(Gst.State.NULL)
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def on_message(self, bus, message):
+        if message.type == Gst.MessageType.EOS:
+            with self._cond:
+                self._stopped = True
+                self._cond.notify_all()
+        elif message.type == Gst.MessageType.ERROR:
+            err, debug = message.parse_error()
+            print('Error: %s' % err, debug)
+            with self._cond:
+                self._stopped = True
+                self._cond.notify_all()
+
     def run(self):
         """ Get frame to update _frame
         """
 
         self.start_gst(
-            [
+            self.config or [
                 self.video_source,
                 self.video_codec,
                 self.video_decode,
@@ -130,9 +517,24 @@ class Video():
 
     def callback(self, sink):
         sample = sink.emit('pull-sample')
-        new_frame = self.gst_to_opencv(sample)
+        if self.mode == 'map':
+            new_frame = sample
+        elif self.mode == 'pool':
+            new_frame = self.gst_to_pool(sample, self.pool)
+        else:
+            new_frame = self.gst_to_opencv(sample)
         self._frame = new_frame
 
+        pts = sample.get_buffer().pts
+        with self._cond:
+            if len(self._frames) >= self.queue_size:
+                old = self._frames.popleft()
+                self.dropped += 1
+                self.release(old.data)
+            self._frames.append(Frame(self.frames, pts, new_frame, 0))
+            self.frames += 1
+            self._cond.notify_all()
+
         return Gst.FlowReturn.OK
 
 
@@ -140,13 +542,18 @@ if __name__ == '__main__':
     # Create the video object
     # Add port= if is necessary to use a different one
     video = Video()
+    # --headless: no window, see run.py for the low rate preview
+    headless = '--headless' in sys.argv[1:]
 
-    while True:
-        # Wait for the next frame
-        if not video.frame_available():
-            continue
+    # Blocks until the next frame instead of spinning on frame_available()
+    for frame in video:
+        if frame.dropped:
+            print('dropped %d frames' % frame.dropped)
 
-        frame = video.frame()
-        cv2.imshow('frame', frame)
+        if headless:
+            continue
+        cv2.imshow('frame', frame.data)
         if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
\ No newline at end of file
+            break
+
+    video.stop()
\ No newline at end of file
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# Per-frame analytics on a pool of worker processes. Frames go through
+# shared memory slots, only the slot number and the (small) result are
+# pickled, so the work scales over every core instead of one GIL.
+#
+# usage: python workers.py [--workers=N] [num-test-cameras | cameras.json | video files...]
+
+import collections
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import cv2
+import numpy as np
+
+# seq: submission number, camera_id and pts: those of the frame, value:
+# what the worker function returned
+Result = collections.namedtuple('Result', ['seq', 'camera_id', 'pts', 'value'])
+
+
+def _attach(name):
+    """Open a segment the parent owns
+
+    Before 3.13 attaching always registers the segment with the resource
+    tracker. Workers share the parent's tracker (WorkerPool starts it before
+    them), so that is a second registration of a name it already has, and
+    unregistering here would drop the parent's: the parent's unlink would then
+    make the tracker print a KeyError, and a crashed parent would leak it.
+    """
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name)
+
+
+def _worker(fn, tasks, results):
+    # one segment per frame size, attached the first time a frame of it comes
+    segments = {}
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            seq, name, slot, slot_bytes, shape, dtype = task
+            if name not in segments:
+                segments[name] = _attach(name)
+            frame = np.ndarray(shape, dtype=dtype, buffer=segments[name].buf, offset=slot * slot_bytes)
+            frame.flags.writeable = False
+            try:
+                value = fn(frame)
+            except Exception as e:
+                value = e
+            # drop the view before the slot goes back to the parent
+            del frame
+            results.put((seq, name, slot, value))
+    finally:
+        for shm in segments.values():
+            shm.close()
+
+
+class WorkerPool():
+    """Fans frames out to worker processes through shared memory slots
+
+    submit() copies a frame into a free slot and queues its slot number; the
+    worker calls fn on a view of the slot and sends back the result, which
+    frees the slot for the next frame. Results are handed out in submission
+    order, i.e. PTS order for frames submitted as they were captured, however
+    the workers finish.
+
+    Every frame size gets its own ring of slots, allocated on the first
+    frame of that size, so cameras of different resolutions share a pool.
+
+    Attributes:
+        slots (int): Frames of one size in flight at most
+        workers (int): Worker processes
+    """
+
+    def __init__(self, fn, workers=None, slots=None, start_method='forkserver'):
+        """Summary
+
+        Args:
+            fn (callable): Module level function taking a read-only (H, W, C)
+                frame and returning something picklable
+            workers (int, optional): Processes, defaults to the number of cores
+            slots (int, optional): Shared frames per frame size, defaults
+                to two per worker
+            start_method (string, optional): multiprocessing start method,
+                forking a process running GStreamer threads is not safe
+        """
+        self.fn = fn
+        self.workers = workers or os.cpu_count()
+        self.slots = slots or 2 * self.workers
+        self._context = multiprocessing.get_context(start_method)
+        # frame bytes to (segment, free slot queue), and segment name to the
+        # same for the collector
+        self._rings = {}
+        self._rings_by_name = {}
+        self._processes = []
+        self._tasks = None
+        self._results = None
+        self._cond = threading.Condition()
+        self._done = {}
+        self._frames = {}
+        self._next_seq = 0
+        self._next_result = 0
+        self._collector = None
+        self._closed = False
+
+    def _start(self):
+        # workers started with 'fork' only share a tracker that already runs
+        resource_tracker.ensure_running()
+        self._tasks = self._context.Queue()
+        self._results = self._context.Queue()
+        for _ in range(self.workers):
+            process = self._context.Process(
+                target=_worker, args=(self.fn, self._tasks, self._results), daemon=True)
+            process.start()
+            self._processes.append(process)
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def _ring(self, slot_bytes):
+        ring = self._rings.get(slot_bytes)
+        if ring is None:
+            shm = shared_memory.SharedMemory(create=True, size=self.slots * slot_bytes)
+            free = queue.Queue()
+            for slot in range(self.slots):
+                free.put(slot)
+            ring = self._rings[slot_bytes] = self._rings_by_name[shm.name] = (shm, free)
+        return ring
+
+    def _collect(self):
+        while True:
+            item = self._results.get()
+            if item is None:
+                break
+            seq, name, slot, value = item
+            self._rings_by_name[name][1].put(slot)
+            with self._cond:
+                self._done[seq] = value
+                self._cond.notify_all()
+
+    def submit(self, camera_id, pts, frame, block=True, timeout=None):
+        """Copy a frame into a slot and queue it
+
+        Args:
+            camera_id (object): Reported back with the result
+            pts (int): Presentation time in ns, reported back with the result
+            frame (np.ndarray): Frame, copied so it can be released right after
+            block (bool, optional): Wait for a free slot, otherwise drop the frame
+            timeout (float, optional): Seconds to wait for a slot
+
+        Returns:
+            int: Submission number, None if the frame was dropped
+        """
+        if self._tasks is None:
+            self._start()
+        shm, free = self._ring(frame.nbytes)
+        try:
+            slot = free.get(block, timeout)
+        except queue.Empty:
+            return None
+        view = np.ndarray(frame.shape, dtype=frame.dtype, buffer=shm.buf, offset=slot * frame.nbytes)
+        view[...] = frame
+        del view
+        seq = self._next_seq
+        self._next_seq += 1
+        with self._cond:
+            self._frames[seq] = (camera_id, pts)
+        self._tasks.put((seq, shm.name, slot, frame.nbytes, frame.shape, frame.dtype.str))
+        return seq
+
+    @property
+    def pending(self):
+        """Submitted frames whose result hasn't been read yet"""
+        return self._next_seq - self._next_result
+
+    def get(self, timeout=None):
+        """Wait for the next result in submission order
+
+        Exceptions raised by fn are raised here.
+
+        Args:
+            timeout (float, optional): Seconds to wait, None waits forever
+
+        Returns:
+            Result: None on timeout or when nothing is pending
+        """
+        with self._cond:
+            seq = self._next_result
+            if seq == self._next_seq:
+                return None
+            if not self._cond.wait_for(lambda: seq in self._done, timeout):
+                return None
+            value = self._done.pop(seq)
+            camera_id, pts = self._frames.pop(seq)
+            self._next_result += 1
+        if isinstance(value, Exception):
+            raise value
+        return Result(seq, camera_id, pts, value)
+
+    def ready(self):
+        """Results that are out without waiting, in submission order
+
+        Returns:
+            list: Result list, possibly empty
+        """
+        results = []
+        while True:
+            with self._cond:
+                if self._next_result not in self._done:
+                    return results
+            results.append(self.get())
+
+    def map(self, source):
+        """Run fn over everything read from a source
+
+        Args:
+            source (object): CaptureManager or batcher.VideoCaptureSource,
+                anything with read(timeout) returning (camera_id, Frame) and
+                a stopped property
+
+        Yields:
+            Result: Next result in submission order
+        """
+        while not source.stopped:
+            item = source.read(0.1)
+            if item is not None:
+                camera_id, frame = item
+                data = frame.data
+                if hasattr(data, 'release'):
+                    # 'map' mode: copy out of the view and unmap right away
+                    with data as view:
+                        self.submit(camera_id, frame.pts, view)
+                else:
+                    self.submit(camera_id, frame.pts, data)
+                    if hasattr(source, 'release'):
+                        source.release(camera_id, data)
+            for result in self.ready():
+                yield result
+        while self.pending:
+            yield self.get()
+
+    def close(self):
+        """Stop the workers and free the slots, pending results are lost"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._tasks is None:
+            return
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+        self._results.put(None)
+        self._collector.join()
+        for shm, free in self._rings.values():
+            shm.close()
+            shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def gray_mean(frame):
+    """Example worker function, the cvtColor of Opencv-read.py"""
+    return float(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY).mean())
+
+
+if __name__ == '__main__':
+    import pipelines
+    from capture import CaptureManager
+
+    args = sys.argv[1:]
+    workers = None
+    if args and args[0].startswith('--workers='):
+        workers = int(args.pop(0).split('=', 1)[1])
+    args = args or ['4']
+    if args[0].isdigit():
+        configs = {'cam%d' % i: pipelines.testsrc(pattern=i) for i in range(int(args[0]))}
+    elif args[0].endswith('.json'):
+        configs = pipelines.load(args[0])
+    else:
+        configs = {path: pipelines.filesrc(path) for path in args}
+
+    manager = CaptureManager(configs)
+    count = 0
+    next_report = time.monotonic() + 1
+    with WorkerPool(gray_mean, workers) as pool:
+        try:
+            for result in pool.map(manager):
+                count += 1
+                if time.monotonic() >= next_report:
+                    next_report += 1
+                    print('{} results/s on {} workers, last {} pts {:.3f} mean {:.1f}'.format(
+                        count, pool.workers, result.camera_id, result.pts / 1e9, result.value))
+                    count = 0
+        except KeyboardInterrupt:
+            pass
+        manager.stop()
@@ -0,0 +1,205 @@
+"""Media library index with a persistent metadata cache
+
+Recordings under the library roots are probed once with the GStreamer
+Discoverer on a process pool; duration, resolution, codec, stream counts
+and a content hash go into an SQLite cache. A rescan only probes files whose
+size or mtime changed, and drops entries of deleted files, so opening the
+browser on tens of thousands of clips reads the cache and nothing else.
+
+usage: python library.py [--db=library.sqlite] [--workers=N] <directory>...
+"""
+
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import GLib, Gst
+
+DEFAULT_DB = os.path.join(GLib.get_user_cache_dir(), 'traffic-app', 'library.sqlite')
+
+EXTENSIONS = ('.mp4', '.mkv', '.avi', '.mov', '.ts', '.webm', '.mpg')
+
+COLUMNS = ('duration', 'video_width', 'video_height', 'video_codec', 'num_video_streams',
+           'num_audio_streams', 'num_subtitle_streams', 'title', 'hash', 'error')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS media (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    duration REAL,
+    video_width INTEGER,
+    video_height INTEGER,
+    video_codec TEXT,
+    num_video_streams INTEGER,
+    num_audio_streams INTEGER,
+    num_subtitle_streams INTEGER,
+    title TEXT,
+    hash TEXT,
+    error TEXT
+)
+'''
+
+
+def probe(path):
+    """Metadata and content hash of one file, runs on the pool
+
+    Returns:
+        dict: COLUMNS, error set and the rest None if the file can't be read
+    """
+    import discovery
+    import thumbnails
+
+    row = dict.fromkeys(COLUMNS)
+    try:
+        fields = discovery.discover(Gst.filename_to_uri(os.path.abspath(path)))
+        row.update((column, fields[column]) for column in COLUMNS if column in fields)
+        # the same key the thumbnail sprite cache uses
+        row['hash'] = thumbnails.file_hash(path)
+    except (OSError, GLib.Error) as e:
+        row['error'] = str(e)
+    return row
+
+
+def walk(roots):
+    """(path, size, mtime) of every recording under roots"""
+    for root in roots:
+        for directory, _, names in os.walk(root):
+            for name in names:
+                if not name.lower().endswith(EXTENSIONS):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+
+class Library:
+    """SQLite backed index of the recordings under some directories"""
+
+    def __init__(self, db_path=DEFAULT_DB):
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._db = sqlite3.connect(db_path)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute(SCHEMA)
+        self._db.commit()
+
+    def scan(self, roots, workers=None):
+        """Bring the cache up to date with the files under roots
+
+        Args:
+            roots (list): Directories to walk
+            workers (int): Probe processes, defaults to the number of cores
+
+        Returns:
+            dict: Numbers of 'probed', 'unchanged' and 'removed' files
+        """
+        roots = [os.path.abspath(root) for root in roots]
+        known = {}
+        for root in roots:
+            for row in self._under(root, 'path, size, mtime'):
+                known[row['path']] = (row['size'], row['mtime'])
+
+        stale = []
+        seen = set()
+        for path, size, mtime in walk(roots):
+            seen.add(path)
+            if known.get(path) != (size, mtime):
+                stale.append((path, size, mtime))
+
+        removed = [path for path in known if path not in seen]
+        self._db.executemany('DELETE FROM media WHERE path = ?', [(path,) for path in removed])
+
+        if stale:
+            # forking a process that has GStreamer threads running is not safe
+            context = multiprocessing.get_context('forkserver')
+            with ProcessPoolExecutor(workers, mp_context=context) as pool:
+                rows = pool.map(probe, [path for path, size, mtime in stale], chunksize=8)
+                for (path, size, mtime), row in zip(stale, rows):
+                    self._db.execute(
+                        'INSERT OR REPLACE INTO media (path, size, mtime, {}) VALUES (?, ?, ?, {})'.format(
+                            ', '.join(COLUMNS), ', '.join('?' * len(COLUMNS))),
+                        (path, size, mtime) + tuple(row[column] for column in COLUMNS))
+        self._db.commit()
+        return {'probed': len(stale), 'unchanged': len(seen) - len(stale), 'removed': len(removed)}
+
+    def entries(self, root=None):
+        """Cached rows, optionally only those under root
+
+        Returns:
+            list: sqlite3.Row per file, ordered by path
+        """
+        if root is None:
+            return self._db.execute('SELECT * FROM media ORDER BY path').fetchall()
+        return self._under(os.path.abspath(root), '*')
+
+    def _under(self, root, columns):
+        # a prefix compare, LIKE would treat _ and % in directory names as wildcards
+        prefix = os.path.join(root, '')
+        return self._db.execute(
+            'SELECT {} FROM media WHERE substr(path, 1, ?) = ? ORDER BY path'.format(columns),
+            (len(prefix), prefix)).fetchall()
+
+    def get(self, path):
+        """Cached row of one file, None if it isn't indexed"""
+        return self._db.execute('SELECT * FROM media WHERE path = ?', (os.path.abspath(path),)).fetchone()
+
+    def fields(self, path):
+        """Metadata of one file as discovery.info_fields() has it
+
+        Only a row matching the file's current size and mtime counts, one
+        stat and one primary key lookup, no Discoverer.
+
+        Returns:
+            dict: The cached fields, None if the file isn't indexed, changed
+                since the scan or couldn't be probed
+        """
+        row = self.get(path)
+        if row is None or row['error']:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if (row['size'], row['mtime']) != (stat.st_size, stat.st_mtime):
+            return None
+        return {column: row[column] for column in COLUMNS if column not in ('hash', 'error')}
+
+    def close(self):
+        self._db.close()
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    db_path, workers = DEFAULT_DB, None
+    while args and args[0].startswith('--'):
+        flag, _, value = args.pop(0).partition('=')
+        if flag == '--db':
+            db_path = value
+        elif flag == '--workers':
+            workers = int(value)
+        else:
+            sys.exit('unknown option ' + flag)
+    if not args:
+        sys.exit(__doc__.strip().splitlines()[-1])
+
+    library = Library(db_path)
+    start = time.monotonic()
+    counts = library.scan(args, workers)
+    print('{probed} probed, {unchanged} unchanged, {removed} removed'.format(**counts),
+          'in {:.1f} s'.format(time.monotonic() - start))
+    for row in library.entries():
+        if row['error']:
+            print('{}: {}'.format(row['path'], row['error']))
+        else:
+            print('{}: {:.1f} s {}x{} {}'.format(row['path'], row['duration'] or 0, row['video_width'],
+                                                row['video_height'], row['video_codec']))
+    library.close()
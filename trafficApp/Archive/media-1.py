@@ -80,10 +80,16 @@ class GstPlayer:
         self.sink = Gst.ElementFactory.make("xvimagesink")
         self.sink.set_property("force-aspect-ratio", True)
 
+        self.is_playing = False
+        # one slider timer at most, only while playing; duration is queried once per file
+        self.timer_id = None
+        self.duration = None
+
     def setup_player(self,f):
         # file to play must be transmitted as uri
         uri = "file://" + os.path.abspath(f)
         self.player.set_property("uri", uri)
+        self.duration = None
 
         # make playbin play in specified DrawingArea widget instead of
         # separate, GstVideo needed
@@ -95,11 +101,15 @@ class GstPlayer:
         self.is_playing = True
         self.player.set_state(Gst.State.PLAYING)
         #starting up a timer to check on the current playback value
-        GLib.timeout_add(1000, self.update_slider)
+        if self.timer_id is None:
+            self.timer_id = GLib.timeout_add(1000, self.update_slider)
 
     def pause(self):
         self.is_playing = False
         self.player.set_state(Gst.State.PAUSED)
+        if self.timer_id is not None:
+            GLib.source_remove(self.timer_id)
+            self.timer_id = None
 
     def current_position(self):
         status,position = self.player.query_position(Gst.Format.TIME)
@@ -111,13 +121,17 @@ class GstPlayer:
 
     def update_slider(self):
         if not self.is_playing:
+            self.timer_id = None
             return False # cancel timeout
         else:
-            success, self.duration = self.player.query_duration(Gst.Format.TIME)
-            # adjust duration and position relative to absolute scale of 100
-            self.mult = 100 / (self.duration / Gst.SECOND)
-            if not success:
-                raise GenericException("Couldn't fetch duration")
+            if self.duration is None:
+                success, duration = self.player.query_duration(Gst.Format.TIME)
+                if not success:
+                    # not known until the file has prerolled, try again on the next tick
+                    return True
+                self.duration = duration
+                # adjust duration and position relative to absolute scale of 100
+                self.mult = 100 / (self.duration / Gst.SECOND)
             # fetching the position, in nanosecs
             success, position = self.player.query_position(Gst.Format.TIME)
             if not success:
@@ -1,9 +1,14 @@
+import math
 import os
 import sys
 
 from eventlib import Event, make_class_level_events
 from weaklib import WeakMethod
 
+import discovery
+import library
+import thumbnails
+
 import gi
 gi.require_version('Gtk', '3.0')
 gi.require_version('Gst', '1.0')
@@ -60,6 +65,14 @@ def make_icon_button(icon, cls=Gtk.Button, size=30):
     return button
 
 
+def format_time(seconds, hours=False):
+    minutes, seconds = divmod(int(seconds), 60)
+    if hours or minutes >= 60:
+        hours, minutes = divmod(minutes, 60)
+        return '%d:%02d:%02d' % (hours, minutes, seconds)
+    return '%d:%02d' % (minutes, seconds)
+
+
 def mainloop_do(callback, *args, **kwargs):
     def cb(_None):
         callback(*args, **kwargs)
@@ -69,44 +82,57 @@ def mainloop_do(callback, *args, **kwargs):
 
 
 class Medium:
-    make_class_level_events(locals(), 'meta_data_updated')
+    """One recording and its metadata
+    
+    Metadata fields are plain slots, reading medium.duration is an attribute
+    lookup. Writes go through update(), which sets any number of fields and
+    emits meta_data_updated once.
+    """
+    
+    __slots__ = ('uri', '_meta_data_updated', '__weakref__') + discovery.FIELDS
     
     def __init__(self, uri):
         self.uri = uri
+        self._meta_data_updated = None
         
-        self._title = None
-        self._artist = None
-        self._album = None
-        self._duration = None
-        self._num_video_streams = None
-        self._num_audio_streams = None
-        self._num_subtitle_streams = None
-        self._video_width = None
-        self._video_height = None
+        for field in discovery.FIELDS:
+            setattr(self, field, None)
         
     @classmethod
     def from_path(cls, path):
-        uri = 'file://' + path
+        uri = Gst.filename_to_uri(os.path.abspath(path))
         return cls.from_uri(uri)
     
     @classmethod
     def from_uri(cls, uri):
         return cls(uri)
     
-    def __getattr__(self, attr):
-        try:
-            return vars(self)['_'+attr]
-        except KeyError:
-            raise AttributeError(attr)
+    @property
+    def meta_data_updated(self):
+        # most media of a library never get a listener, the event is made on first use
+        if self._meta_data_updated is None:
+            self._meta_data_updated = Event()
+        return self._meta_data_updated
     
-    def __setattr__(self, attr, value):
-        attrs = vars(self)
-        
-        if attr.startswith('_') or '_'+attr not in attrs:
-            attrs[attr] = value
-        else:
-            attrs['_'+attr] = value
-            self.meta_data_updated.emit()
+    @property
+    def path(self):
+        # file uris are percent-encoded, the path is the decoded file name
+        if self.uri.startswith('file://'):
+            return GLib.filename_from_uri(self.uri)[0]
+        return self.uri
+    
+    def update(self, **fields):
+        """Set metadata fields, one meta_data_updated for all of them"""
+        changed = False
+        for field, value in fields.items():
+            if field not in discovery.FIELDS:
+                raise AttributeError(field)
+            if getattr(self, field) != value:
+                setattr(self, field, value)
+                changed = True
+        
+        if changed and self._meta_data_updated is not None:
+            self._meta_data_updated.emit()
     
     @property
     def has_video(self):
@@ -186,9 +212,10 @@ class VideoPlayer:
         
         self._playbin = Gst.ElementFactory.make('playbin', 'playbin')
         
-        callback = WeakMethod(self._on_meta_data_found)
-        for event in ('video-tags-changed', 'audio-tags-changed'):
-            self._playbin.connect(event, callback)
+        # metadata comes from the headers once per medium, not from playback tags;
+        # files a library scan has seen are read from its cache instead
+        self._discoverer = discovery.AsyncDiscoverer(WeakMethod(self._on_discovered))
+        self.library = library.Library() if os.path.exists(library.DEFAULT_DB) else None
         
         bus = self._playbin.get_bus()
         bus.add_signal_watch()
@@ -214,9 +241,9 @@ class VideoPlayer:
         #  else:
             #  imagesink.set_window_handle(self.window_handle)
     
-    def _on_meta_data_found(self, playbin, stream):
-        if self.medium.duration is None:
-            self.medium.duration = self._playbin.query_duration(Gst.Format.TIME)[1] / Gst.SECOND
+    def _on_discovered(self, uri, fields):
+        if fields is not None and self.medium is not None and self.medium.uri == uri:
+            self.medium.update(**fields)
     
     @staticmethod
     def _on_destroy(self):
@@ -275,6 +302,12 @@ class VideoPlayer:
         self._medium = medium
         
         self._playbin.set_property('uri', medium.uri)
+        if medium.duration is None and self.library is not None and medium.uri.startswith('file://'):
+            fields = self.library.fields(medium.path)
+            if fields is not None:
+                medium.update(**fields)
+        if medium.duration is None:
+            self._discoverer.discover(medium.uri)
         
         self.medium_changed.emit(medium)
     
@@ -381,6 +414,21 @@ class VideoPlayerWithControls(VideoPlayer, Gtk.Grid):
         self._on_seek_cb_id = self._seek_slider.connect('value-changed', WeakMethod(self._on_seek))
         slider_hbox.pack_start(self._seek_slider, True, True, 0)
         
+        # scrub previews come from the thumbnail sprite, the playbin only seeks on release
+        self._sprite = None
+        self._scrubbing = False
+        self._preview_image = Gtk.Image()
+        self._preview = Gtk.Popover.new(self._seek_slider)
+        self._preview.set_modal(False)
+        self._preview.set_position(Gtk.PositionType.TOP)
+        self._preview.add(self._preview_image)
+        self._seek_slider.add_events(Gdk.EventMask.POINTER_MOTION_MASK | Gdk.EventMask.LEAVE_NOTIFY_MASK)
+        self._seek_slider.connect('motion-notify-event', WeakMethod(self._on_slider_motion))
+        self._seek_slider.connect('leave-notify-event', WeakMethod(self._on_slider_leave))
+        self._seek_slider.connect('button-press-event', WeakMethod(self._on_slider_pressed))
+        self._seek_slider.connect('button-release-event', WeakMethod(self._on_slider_released))
+        self.medium_changed.connect(WeakMethod(self._on_medium_changed), argnames=('medium',))
+        
         self._video_progress_label = Gtk.Label()
         slider_hbox.pack_start(self._video_progress_label, False, False, 0)
         
@@ -432,7 +480,16 @@ class VideoPlayerWithControls(VideoPlayer, Gtk.Grid):
         
         self.connect('key-press-event', self._on_key_pressed)
         
-        GLib.timeout_add(1000/30, WeakMethod(self._update_video_position))
+        # the position timer only runs while playing and visible, see _update_timer()
+        self._position_timer = None
+        self._timer_interval = None
+        self._playing = False
+        self._duration = None
+        self._hours = False
+        self._total_text = ''
+        self._shown_second = None
+        self.connect('map', WeakMethod(self._on_mapped_changed))
+        self.connect('unmap', WeakMethod(self._on_mapped_changed))
     
     def _on_play_pause_button_clicked(self, button):
         self.toggle_play_pause()
@@ -445,55 +502,122 @@ class VideoPlayerWithControls(VideoPlayer, Gtk.Grid):
         
         img_widget = self._play_pause_button.get_children()[0]
         mainloop_do(img_widget.set_from_icon_name, icon, Gtk.IconSize.LARGE_TOOLBAR)
+        # the requested state, the playbin may still be on its way there
+        self._playing = state == Gst.State.PLAYING
+        mainloop_do(self._update_timer)
+        # show where a pause or seek left off without waiting for a tick
+        mainloop_do(self._update_video_position)
+    
+    def _on_mapped_changed(self, widget):
+        self._update_timer()
+    
+    def _timer_wanted(self):
+        """Milliseconds between position updates, None when no timer should run
+        
+        One slider pixel per tick, but never faster than 10 Hz (the label only
+        changes once a second) nor slower than 1 Hz.
+        """
+        if not self.get_mapped() or not self._playing:
+            return None
+        
+        if not self._duration:
+            return 1000
+        width = max(self._seek_slider.get_allocated_width(), 1)
+        return int(min(max(self._duration * 1000 / width, 100), 1000))
+    
+    def _update_timer(self):
+        interval = self._timer_wanted()
+        if interval == self._timer_interval:
+            return
+        
+        if self._position_timer is not None:
+            GLib.source_remove(self._position_timer)
+            self._position_timer = None
+        self._timer_interval = interval
+        if interval is not None:
+            self._position_timer = GLib.timeout_add(interval, WeakMethod(self._on_position_timer))
+    
+    def _on_position_timer(self):
+        self._update_video_position()
+        return True
     
     def _on_seek(self, scale):
+        if self._scrubbing:
+            return
+        
         position = scale.get_value()
         position = self.medium.duration * position / scale.get_adjustment().get_upper()
         self.seek_to(position)
     
+    def _on_medium_changed(self, medium):
+        self._sprite = None
+        self._preview.hide()
+        if medium.uri.startswith('file://'):
+            thumbnails.load_async(medium.path,
+                                  lambda sprite: self._on_sprite_ready(medium, sprite))
+    
+    def _on_sprite_ready(self, medium, sprite):
+        # a sprite for a medium that was replaced meanwhile is dropped
+        if medium is self.medium:
+            self._sprite = sprite
+    
+    def _on_slider_motion(self, scale, event):
+        if self._sprite is None or self.medium is None or not self.medium.duration:
+            return False
+        
+        fraction = min(max(event.x / max(scale.get_allocated_width(), 1), 0.0), 1.0)
+        self._preview_image.set_from_pixbuf(self._sprite.tile_at(self.medium.duration * fraction))
+        
+        rect = Gdk.Rectangle()
+        rect.x, rect.y, rect.width, rect.height = int(event.x), 0, 1, 1
+        self._preview.set_pointing_to(rect)
+        if not self._preview.get_visible():
+            self._preview.show_all()
+        return False
+    
+    def _on_slider_leave(self, scale, event):
+        if not self._scrubbing:
+            self._preview.hide()
+        return False
+    
+    def _on_slider_pressed(self, scale, event):
+        self._scrubbing = True
+        return False
+    
+    def _on_slider_released(self, scale, event):
+        self._scrubbing = False
+        self._preview.hide()
+        # one flushing seek for the whole drag
+        GLib.idle_add(lambda: self._on_seek(scale))
+        return False
+    
     def _on_volume_slider_changed(self, volume_button, value):
         self.volume = value
     
     def _update_video_position(self):
-        if self.medium is None or self.medium.duration is None or self.medium.duration <= 0:
-            return True
-        
-        def duration(time):
-            result = ''
-            time = int(time)
-            for mod in (60, 60):
-                result = '%02d:%s'%(time%mod, result)
-                time = int(time/mod)
-                if time == 0:
-                    break
-            
-            result = result[:-1]
-            if time > 0 or ':' not in result:
-                result = '%02d:%s'%(time%mod, result)
-            
-            return result
-            
-        def durations():
-            current = duration(current_time)
-            total = duration(self.medium.duration)
-            current = '00:'*(total.count(':')-current.count(':'))+current
-            
-            if current.startswith('00'):
-                current = current[1:]
-            if total.startswith('00'):
-                total = total[1:]
-            
-            return '%s / %s'%(current, total)
+        medium = self.medium
+        if medium is None or not medium.duration or medium.duration <= 0:
+            return
+        if self._scrubbing:
+            return
         
-        self._seek_slider.disconnect(self._on_seek_cb_id)
+        if medium.duration != self._duration:
+            self._duration = medium.duration
+            self._hours = self._duration >= 3600
+            self._total_text = format_time(self._duration, self._hours)
+            self._shown_second = None
+            self._update_timer()
         
         current_time = self.current_time
-        self._seek_slider.set_value(current_time/self.medium.duration*100)
-        self._video_progress_label.set_text(durations())
-        
-        self._on_seek_cb_id = self._seek_slider.connect('value-changed', WeakMethod(self._on_seek))
+        self._seek_slider.handler_block(self._on_seek_cb_id)
+        self._seek_slider.set_value(current_time/self._duration*100)
+        self._seek_slider.handler_unblock(self._on_seek_cb_id)
         
-        return True
+        # the label only changes once a second
+        second = int(current_time)
+        if second != self._shown_second:
+            self._shown_second = second
+            self._video_progress_label.set_text('%s / %s' % (format_time(second, self._hours), self._total_text))
     
     @staticmethod
     def _on_key_pressed(self, event):
@@ -542,13 +666,282 @@ class VideoPlayerWithControls(VideoPlayer, Gtk.Grid):
         self.show_all()
     
 
+
+class VideoWall(Gtk.Bin):
+    """Several streams in a grid, composited in one pipeline with one video sink
+    
+    Every stream is decoded once and scaled to its tile right after the
+    decoder, before any conversion, so videoconvert and the compositor only
+    touch tile sized frames. scaler='nvvidconv' (Jetson) scales the hardware
+    decoder's NVMM frames before they reach system memory at all. Tiles follow
+    the window size; resizing renegotiates the tile caps.
+    
+    A stream that fails, e.g. one camera going offline, takes only its own
+    branch out of the pipeline; its tile turns black and the others play on.
+    """
+    
+    TILE_CAPS = 'video/x-raw, width={}, height={}, pixel-aspect-ratio=1/1'
+    
+    # element names of branch i are these plus i, upstream first
+    BRANCH = ('source', 'scale', 'tile', 'convert', 'queue')
+    
+    def __init__(self, uris, scaler='videoscale'):
+        super().__init__()
+        
+        self.uris = list(uris)
+        self.columns = max(int(math.ceil(math.sqrt(len(self.uris)))), 1)
+        self.rows = max(-(-len(self.uris) // self.columns), 1)
+        self._tile_size = None
+        self._layout_timer = None
+        self._state = Gst.State.NULL
+        self.failed = set()
+        
+        self._canvas = VideoCanvas()
+        self._canvas.connect('size-allocate', WeakMethod(self._on_canvas_allocated))
+        self.add(self._canvas)
+        
+        branches = []
+        for i, uri in enumerate(self.uris):
+            branches.append(
+                'uridecodebin name=source{i} uri="{}" ! {} name=scale{i} '
+                '! capsfilter name=tile{i} caps="{}" ! videoconvert name=convert{i} '
+                '! queue name=queue{i} max-size-buffers=2 ! mix.sink_{i}'.format(
+                    uri, scaler, self.TILE_CAPS.format(320, 180), i=i))
+        self._pipeline = Gst.parse_launch(
+            'compositor name=mix background=black ! videoconvert ! xvimagesink name=sink '
+            + ' '.join(branches))
+        self._mixer = self._pipeline.get_by_name('mix')
+        
+        bus = self._pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect('message::error', self._on_error)
+        bus.enable_sync_message_emission()
+        bus.connect('sync-message::element', self._on_sync_message)
+        
+        self.connect('destroy', self._on_destroy)
+    
+    def _on_sync_message(self, bus, message):
+        if message.get_structure().get_name() == 'prepare-window-handle':
+            message.src.set_window_handle(self._canvas.window_handle)
+    
+    def _on_error(self, bus, message):
+        err, debug = message.parse_error()
+        print(err, debug)
+        
+        i = self._branch_of(message.src)
+        if i is None or len(self.failed | {i}) == len(self.uris):
+            # the compositor or the sink failed, or no stream is left
+            self.stop()
+        elif i not in self.failed:
+            self._remove_branch(i)
+    
+    def _branch_of(self, element):
+        """Index of the branch element belongs to, None for the shared part"""
+        while element is not None:
+            parent = element.get_parent()
+            if parent is self._pipeline:
+                for i in range(len(self.uris)):
+                    if element.get_name() in self._branch_names(i):
+                        return i
+                return None
+            element = parent
+        return None
+    
+    def _branch_names(self, i):
+        return [prefix + str(i) for prefix in self.BRANCH]
+    
+    def _remove_branch(self, i):
+        self.failed.add(i)
+        
+        # released first: it flushes, waking a queue thread blocked in the compositor
+        pad = self._mixer.get_static_pad('sink_%d' % i)
+        if pad is not None:
+            self._mixer.release_request_pad(pad)
+        for name in self._branch_names(i):
+            element = self._pipeline.get_by_name(name)
+            element.set_locked_state(True)
+            element.set_state(Gst.State.NULL)
+            self._pipeline.remove(element)
+        
+        # a stream failing on startup fails the state change, retry without it
+        self._pipeline.set_state(self._state)
+    
+    @staticmethod
+    def _on_destroy(self):
+        self.stop()
+    
+    def _on_canvas_allocated(self, canvas, allocation):
+        # a window drag allocates many sizes, lay out once it settles
+        if self._layout_timer is not None:
+            GLib.source_remove(self._layout_timer)
+        self._layout_timer = GLib.timeout_add(200, WeakMethod(self._layout), allocation.width, allocation.height)
+    
+    def _layout(self, width, height):
+        self._layout_timer = None
+        
+        # even sizes, most raw formats need them
+        tile_width = max(width // self.columns, 2) & ~1
+        tile_height = max(height // self.rows, 2) & ~1
+        if (tile_width, tile_height) == self._tile_size:
+            return False
+        self._tile_size = tile_width, tile_height
+        
+        caps = Gst.Caps.from_string(self.TILE_CAPS.format(tile_width, tile_height))
+        for i in range(len(self.uris)):
+            if i in self.failed:
+                continue
+            self._pipeline.get_by_name('tile%d' % i).set_property('caps', caps)
+            pad = self._mixer.get_static_pad('sink_%d' % i)
+            pad.set_property('xpos', (i % self.columns) * tile_width)
+            pad.set_property('ypos', (i // self.columns) * tile_height)
+        return False
+    
+    def _set_state(self, state):
+        self._state = state
+        self._pipeline.set_state(state)
+    
+    def play(self):
+        self._set_state(Gst.State.PLAYING)
+    
+    def pause(self):
+        self._set_state(Gst.State.PAUSED)
+    
+    def stop(self):
+        self._set_state(Gst.State.NULL)
+    
+
+class SyncedPlayer(VideoWall):
+    """Recordings of one scene from several cameras, played in lockstep
+    
+    All recordings are branches of the wall's single pipeline, so they run
+    on one clock with one base time and never drift apart. A seek is one
+    flushing seek on the pipeline that the compositor hands to every
+    branch, and it is ACCURATE rather than KEY_UNIT: the cameras have their
+    keyframes in different places, snapping each one to its own would put
+    them out of step again.
+    
+    offsets[i] is where recording i starts on the common timeline in
+    seconds; a camera that began recording 1.5 s after the first has
+    offset 1.5. Offsets are applied as running time offsets on the
+    branch, in ns, so they are exact to the frame.
+    """
+    
+    def __init__(self, uris, offsets=None, scaler='videoscale'):
+        super().__init__(uris, scaler)
+        
+        self._playing = False
+        self.offsets = [0.0] * len(self.uris)
+        for i, offset in enumerate(offsets or ()):
+            self.set_offset(i, offset)
+    
+    def set_offset(self, index, seconds):
+        self.offsets[index] = seconds
+        if index in self.failed:
+            return
+        pad = self._pipeline.get_by_name('tile%d' % index).get_static_pad('src')
+        pad.set_offset(int(round(seconds * Gst.SECOND)))
+        
+        # buffers already queued carry the old offset, flush them
+        if self._pipeline.get_state(0)[1] in (Gst.State.PAUSED, Gst.State.PLAYING):
+            self.seek_to(self.current_time)
+    
+    def play(self):
+        self._playing = True
+        super().play()
+    
+    def pause(self):
+        self._playing = False
+        super().pause()
+    
+    def stop(self):
+        self._playing = False
+        super().stop()
+    
+    def toggle_play_pause(self):
+        if self._playing:
+            self.pause()
+        else:
+            self.play()
+    
+    @property
+    def current_time(self):
+        return self._pipeline.query_position(Gst.Format.TIME)[1] / Gst.SECOND
+    
+    @property
+    def duration(self):
+        """End of the common timeline, the latest end of any recording
+        
+        The pipeline's own duration query ignores the offsets, so every
+        branch is asked upstream of its offset pad and its offset added.
+        """
+        ends = []
+        for i, offset in enumerate(self.offsets):
+            if i in self.failed:
+                continue
+            pad = self._pipeline.get_by_name('tile%d' % i).get_static_pad('sink')
+            ok, duration = pad.peer_query_duration(Gst.Format.TIME)
+            if ok and duration >= 0:
+                ends.append(duration / Gst.SECOND + offset)
+        return max(ends) if ends else None
+    
+    def seek_to(self, value):
+        flags = Gst.SeekFlags.FLUSH | Gst.SeekFlags.ACCURATE
+        self._pipeline.seek_simple(Gst.Format.TIME, flags, int(value * Gst.SECOND))
+    
+    def seek_forward(self, value):
+        value = self.current_time + value
+        if self.duration is not None:
+            value = min(self.duration, value)
+        self.seek_to(value)
+    
+    def seek_backward(self, value):
+        value = max(0, self.current_time - value)
+        self.seek_to(value)
+    
+
+# one uri or file plays with controls, several make a wall; several files
+# play in sync, seconds each recording starts after the first in --offsets:
+#   python media-2.py [--offsets=0,1.5,...] [uri | file]...
+args = sys.argv[1:]
+offsets = None
+if args and args[0].startswith('--offsets='):
+    offsets = [float(offset) for offset in args.pop(0).partition('=')[2].split(',')]
+uris = [arg if '://' in arg else Gst.filename_to_uri(os.path.abspath(arg)) for arg in args]
+
 win = Gtk.Window()
 win.set_default_size(500, 400)
 win.connect('destroy', Gtk.main_quit)
 
-player = VideoPlayerWithControls()
-win.add(player)
+def on_synced_key_press(win, event, wall):
+    if event.keyval == 32: # space
+        wall.toggle_play_pause()
+    elif event.keyval == 65361: # leftarrow
+        wall.seek_backward(5)
+    elif event.keyval == 65363: # rightarrow
+        wall.seek_forward(5)
+    elif event.keyval == 44: # comma, one frame at 25 fps
+        wall.seek_backward(0.04)
+    elif event.keyval == 46: # period
+        wall.seek_forward(0.04)
+    else:
+        return False
+    return True
 
-win.show_all()
-player.play_uri('https://thumbs.gfycat.com/FatalFlamboyantGrackle-mobile.mp4')
+if len(uris) > 1 and all(uri.startswith('file://') for uri in uris):
+    wall = SyncedPlayer(uris, offsets)
+    win.connect('key-press-event', on_synced_key_press, wall)
+    win.add(wall)
+    win.show_all()
+    wall.play()
+elif len(uris) > 1:
+    wall = VideoWall(uris)
+    win.add(wall)
+    win.show_all()
+    wall.play()
+else:
+    player = VideoPlayerWithControls()
+    win.add(player)
+    
+    win.show_all()
+    player.play_uri(uris[0] if uris else 'https://thumbs.gfycat.com/FatalFlamboyantGrackle-mobile.mp4')
 Gtk.main()
\ No newline at end of file
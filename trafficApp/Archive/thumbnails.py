@@ -0,0 +1,182 @@
+"""Scrub preview sprites for the media player
+
+A sprite is one JPEG holding a grid of small thumbnails plus an index.json
+with the time of every tile. It is built once per recording in a
+background thread and cached under CACHE_DIR/<file hash>/, so the seek
+slider can show previews without touching the playbin.
+
+Only keyframes are decoded: every thumbnail is a KEY_UNIT seek in PAUSED
+and the preroll frame, so a 2 hour file costs a couple of hundred keyframe
+decodes instead of a full pass.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+import gi
+gi.require_version('Gst', '1.0')
+gi.require_version('GdkPixbuf', '2.0')
+from gi.repository import Gst, GLib, GdkPixbuf
+
+CACHE_DIR = os.path.join(GLib.get_user_cache_dir(), 'traffic-app', 'thumbnails')
+
+# bytes hashed from each end of the file, hashing whole recordings would cost
+# more than the sprite
+HASH_CHUNK = 1 << 20
+
+
+def file_hash(path):
+    """Content key of a recording: its size and its first and last MiB"""
+    digest = hashlib.sha1()
+    size = os.path.getsize(path)
+    digest.update(str(size).encode())
+    with open(path, 'rb') as f:
+        digest.update(f.read(HASH_CHUNK))
+        if size > 2 * HASH_CHUNK:
+            f.seek(-HASH_CHUNK, os.SEEK_END)
+            digest.update(f.read(HASH_CHUNK))
+    return digest.hexdigest()
+
+
+class Sprite:
+    """Thumbnail grid of one recording
+
+    Attributes:
+        columns (int): Tiles per row
+        pixbuf (GdkPixbuf.Pixbuf): The whole sheet
+        tile_height (int): Tile height in pixels
+        tile_width (int): Tile width in pixels
+        times (list): Seconds of every tile, row by row
+    """
+
+    def __init__(self, pixbuf, index):
+        self.pixbuf = pixbuf
+        self.tile_width = index['tile_width']
+        self.tile_height = index['tile_height']
+        self.columns = index['columns']
+        self.times = index['times']
+
+    @classmethod
+    def load(cls, directory):
+        """Sprite cached in directory, None if there is none"""
+        try:
+            with open(os.path.join(directory, 'index.json')) as f:
+                index = json.load(f)
+            pixbuf = GdkPixbuf.Pixbuf.new_from_file(os.path.join(directory, 'sprite.jpg'))
+        except (OSError, ValueError, GLib.Error):
+            return None
+        return cls(pixbuf, index)
+
+    def tile_at(self, time):
+        """Thumbnail of the last keyframe at or before time seconds
+
+        Returns:
+            GdkPixbuf.Pixbuf: Tile sharing the sheet's pixels, None if empty
+        """
+        if not self.times:
+            return None
+        i = 0
+        lo, hi = 0, len(self.times)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.times[mid] <= time:
+                i, lo = mid, mid + 1
+            else:
+                hi = mid
+        x = (i % self.columns) * self.tile_width
+        y = (i // self.columns) * self.tile_height
+        return self.pixbuf.new_subpixbuf(x, y, self.tile_width, self.tile_height)
+
+
+def generate(path, directory, max_tiles=200, min_interval=2.0, tile_width=160, columns=10):
+    """Build and store the sprite of a recording
+
+    Args:
+        path (str): Video file
+        directory (str): Where sprite.jpg and index.json go
+        max_tiles (int): Thumbnails at most, spread over the duration
+        min_interval (float): Seconds between thumbnails at least
+        tile_width (int): Thumbnail width, the height keeps the aspect ratio
+        columns (int): Tiles per row
+
+    Returns:
+        Sprite: The new sprite, None if the file has no video
+    """
+    pipeline = Gst.parse_launch(
+        'filesrc location="{}" ! decodebin ! videoconvert ! videoscale '
+        '! video/x-raw, format=RGB, width={}, pixel-aspect-ratio=1/1 '
+        '! appsink name=sink sync=false max-buffers=1'.format(path, tile_width))
+    sink = pipeline.get_by_name('sink')
+    tiles = []
+    try:
+        pipeline.set_state(Gst.State.PAUSED)
+        if pipeline.get_state(Gst.CLOCK_TIME_NONE)[0] == Gst.StateChangeReturn.FAILURE:
+            return None
+        ok, duration = pipeline.query_duration(Gst.Format.TIME)
+        if not ok or duration <= 0:
+            return None
+        interval = max(duration / Gst.SECOND / max_tiles, min_interval)
+
+        t = 0.0
+        flags = Gst.SeekFlags.FLUSH | Gst.SeekFlags.KEY_UNIT | Gst.SeekFlags.SNAP_BEFORE
+        while t * Gst.SECOND < duration:
+            pipeline.seek_simple(Gst.Format.TIME, flags, int(t * Gst.SECOND))
+            pipeline.get_state(Gst.CLOCK_TIME_NONE)
+            sample = sink.emit('pull-preroll')
+            t += interval
+            if sample is None:
+                continue
+            pts = sample.get_buffer().pts / Gst.SECOND
+            # long GOPs snap several positions to the same keyframe
+            if tiles and pts <= tiles[-1][0]:
+                continue
+            tiles.append((pts, sample))
+    finally:
+        pipeline.set_state(Gst.State.NULL)
+
+    if not tiles:
+        return None
+    structure = tiles[0][1].get_caps().get_structure(0)
+    width, height = structure.get_value('width'), structure.get_value('height')
+    rows = -(-len(tiles) // columns)
+    sheet = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, False, 8, width * columns, height * rows)
+    sheet.fill(0)
+    for i, (pts, sample) in enumerate(tiles):
+        buf = sample.get_buffer()
+        data = buf.extract_dup(0, buf.get_size())
+        tile = GdkPixbuf.Pixbuf.new_from_bytes(GLib.Bytes.new(data), GdkPixbuf.Colorspace.RGB,
+                                               False, 8, width, height, len(data) // height)
+        tile.copy_area(0, 0, width, height, sheet, (i % columns) * width, (i // columns) * height)
+
+    index = {'tile_width': width, 'tile_height': height, 'columns': columns,
+             'times': [pts for pts, sample in tiles]}
+    os.makedirs(directory, exist_ok=True)
+    sheet.savev(os.path.join(directory, 'sprite.jpg'), 'jpeg', ['quality'], ['80'])
+    # the index goes last, Sprite.load() only trusts complete entries
+    tmp = os.path.join(directory, 'index.json.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp, os.path.join(directory, 'index.json'))
+    return Sprite(sheet, index)
+
+
+def load_async(path, callback):
+    """Cached sprite of path, generated in a background thread if needed
+
+    callback(sprite) runs on the GLib main loop; sprite is None when the
+    file has no video or can't be read.
+    """
+    def run():
+        sprite = None
+        try:
+            directory = os.path.join(CACHE_DIR, file_hash(path))
+            sprite = Sprite.load(directory) or generate(path, directory)
+        except (OSError, GLib.Error) as e:
+            print('Thumbnails for %s failed: %s' % (path, e))
+        GLib.idle_add(callback, sprite)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import cv2 as cv
+import numpy as np
+
+
+def encode_image(path, frame, params):
+    """Encode one frame and write it, runs on the pool
+
+    Returns the number of bytes written.
+    """
+    ok, data = cv.imencode(os.path.splitext(path)[1], frame, params)
+    if not ok:
+        raise IOError("Could not encode %s" % path)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return len(data)
+
+
+def write_chunk(path, frames):
+    """Write a stack of raw frames as one .npy file, runs on the pool"""
+    np.save(path, frames)
+    return frames.nbytes
+
+
+class FrameArchiver:
+    """Writes frames to disk off the capture loop
+
+    Frames are encoded on a thread or process pool. At most max_pending jobs
+    are in flight: write() blocks when the pool falls behind, or drops the
+    frame when drop is set.
+
+    Formats:
+        jpg: one frame%d.jpg per frame, quality 0-100
+        png: one frame%d.png per frame, compression 0-9 via quality
+        npy: chunk%d.npy holding chunk_size stacked raw frames, no encoding
+    """
+
+    def __init__(self, path, fmt='jpg', quality=None, workers=2, max_pending=32,
+                 drop=False, chunk_size=64, processes=False):
+        if fmt not in ('jpg', 'png', 'npy'):
+            raise ValueError("Unknown format: %s" % fmt)
+        os.makedirs(path, exist_ok=True)
+
+        self.path = path
+        self.fmt = fmt
+        self.drop = drop
+        self.chunk_size = chunk_size
+        if fmt == 'jpg':
+            self.params = [cv.IMWRITE_JPEG_QUALITY, 95 if quality is None else quality]
+        elif fmt == 'png':
+            self.params = [cv.IMWRITE_PNG_COMPRESSION, 3 if quality is None else quality]
+        else:
+            self.params = []
+
+        # encoding releases the GIL, threads are enough unless frames are tiny
+        pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+        self._pool = pool(max_workers=workers)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._chunk = []
+        self._chunk_index = 0
+        self._errors = []
+
+        self.count = 0
+        self.written = 0
+        self.dropped = 0
+        self.bytes = 0
+        self._start = time.monotonic()
+
+    def write(self, frame):
+        """Queue a frame, returns False if it was dropped"""
+        index = self.count
+        self.count += 1
+
+        if self.fmt == 'npy':
+            self._chunk.append(frame)
+            if len(self._chunk) < self.chunk_size:
+                return True
+            return self._flush_chunk()
+
+        path = os.path.join(self.path, "frame%d.%s" % (index, self.fmt))
+        if not self._acquire():
+            return False
+        self._submit(1, encode_image, path, frame, self.params)
+        return True
+
+    def _flush_chunk(self):
+        frames, self._chunk = self._chunk, []
+        if not frames:
+            return True
+        if not self._acquire(len(frames)):
+            return False
+        path = os.path.join(self.path, "chunk%d.npy" % self._chunk_index)
+        self._chunk_index += 1
+        self._submit(len(frames), write_chunk, path, np.stack(frames))
+        return True
+
+    def _acquire(self, frames=1):
+        if self._slots.acquire(blocking=not self.drop):
+            return True
+        with self._lock:
+            self.dropped += frames
+        return False
+
+    def _submit(self, frames, fn, *args):
+        future = self._pool.submit(fn, *args)
+        future.add_done_callback(lambda f: self._done(f, frames))
+
+    def _done(self, future, frames):
+        self._slots.release()
+        with self._lock:
+            if future.exception() is not None:
+                self._errors.append(future.exception())
+                return
+            self.written += frames
+            self.bytes += future.result()
+
+    def stats(self):
+        """Frames written/dropped and encode throughput since start"""
+        with self._lock:
+            elapsed = max(time.monotonic() - self._start, 1e-9)
+            return {
+                'written': self.written,
+                'dropped': self.dropped,
+                'pending': self.count - self.written - self.dropped - len(self._chunk),
+                'fps': self.written / elapsed,
+                'mb_per_s': self.bytes / elapsed / 1e6,
+                'errors': len(self._errors),
+            }
+
+    def close(self):
+        """Flush the last chunk and wait for all writes"""
+        if self.fmt == 'npy':
+            self._flush_chunk()
+        self._pool.shutdown(wait=True)
+        if self._errors:
+            raise self._errors[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
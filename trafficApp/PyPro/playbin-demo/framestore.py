@@ -0,0 +1,144 @@
+import json
+import os
+
+import numpy as np
+
+# Layout of a frame store directory:
+#   meta.json         shape, dtype and frames per chunk
+#   index.bin         int64 pts in ns, one per frame, in append order
+#   chunk%06d.bin     chunk_frames raw frames back to back
+# Frame n lives in chunk n // chunk_frames at slot n % chunk_frames, so the
+# index only needs the pts.
+
+META = 'meta.json'
+INDEX = 'index.bin'
+
+
+def chunk_name(n):
+    return 'chunk%06d.bin' % n
+
+
+class FrameStoreWriter:
+    """Appends fixed-shape frames to memory-mapped chunk files"""
+
+    def __init__(self, path, shape=None, dtype=np.uint8, chunk_frames=512):
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, META)):
+            raise FileExistsError("Frame store already exists: %s" % path)
+
+        self.path = path
+        self.shape = tuple(shape) if shape is not None else None
+        self.dtype = np.dtype(dtype)
+        self.chunk_frames = chunk_frames
+        self.count = 0
+        self._chunk = None
+        self._index = open(os.path.join(path, INDEX), 'ab')
+
+    def _write_meta(self):
+        meta = {'shape': list(self.shape), 'dtype': self.dtype.str,
+                'chunk_frames': self.chunk_frames}
+        with open(os.path.join(self.path, META), 'w') as f:
+            json.dump(meta, f)
+
+    def _close_chunk(self, frames):
+        if self._chunk is None:
+            return
+        filename = self._chunk.filename
+        self._chunk.flush()
+        self._chunk = None
+        # a partly filled last chunk is trimmed to the frames it holds
+        os.truncate(filename, frames * self.frame_bytes)
+
+    @property
+    def frame_bytes(self):
+        return int(np.prod(self.shape)) * self.dtype.itemsize
+
+    def append(self, frame, pts):
+        """Copy a frame into the store, pts in ns"""
+        if self.shape is None:
+            self.shape = frame.shape
+        if frame.shape != self.shape:
+            raise ValueError("Frame shape %s does not match store shape %s" % (frame.shape, self.shape))
+        if self.count == 0:
+            self._write_meta()
+
+        slot = self.count % self.chunk_frames
+        if slot == 0:
+            self._close_chunk(self.chunk_frames)
+            filename = os.path.join(self.path, chunk_name(self.count // self.chunk_frames))
+            self._chunk = np.memmap(filename, dtype=self.dtype, mode='w+',
+                                    shape=(self.chunk_frames,) + self.shape)
+
+        self._chunk[slot] = frame
+        self._index.write(np.int64(pts).tobytes())
+        self.count += 1
+
+    def close(self):
+        used = self.count % self.chunk_frames or self.chunk_frames
+        self._close_chunk(used)
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FrameStore:
+    """Read-only random access to a frame store
+
+    Frames and time ranges come back as views of the memory-mapped chunks,
+    nothing is decoded or copied until the caller touches the pixels.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, META)) as f:
+            meta = json.load(f)
+        self.path = path
+        self.shape = tuple(meta['shape'])
+        self.dtype = np.dtype(meta['dtype'])
+        self.chunk_frames = meta['chunk_frames']
+        self.pts = np.fromfile(os.path.join(path, INDEX), dtype=np.int64)
+        self._chunks = {}
+
+    def __len__(self):
+        return len(self.pts)
+
+    def _chunk(self, n):
+        chunk = self._chunks.get(n)
+        if chunk is None:
+            chunk = np.memmap(os.path.join(self.path, chunk_name(n)), dtype=self.dtype, mode='r')
+            chunk = chunk.reshape((-1,) + self.shape)
+            self._chunks[n] = chunk
+        return chunk
+
+    def __getitem__(self, n):
+        if n < 0:
+            n += len(self)
+        if not 0 <= n < len(self):
+            raise IndexError(n)
+        return self._chunk(n // self.chunk_frames)[n % self.chunk_frames]
+
+    def index_at(self, pts):
+        """Index of the last frame with pts <= the given pts"""
+        return max(int(np.searchsorted(self.pts, pts, side='right')) - 1, 0)
+
+    def frame_at(self, pts):
+        return self[self.index_at(pts)]
+
+    def slice(self, start, stop):
+        """Frames [start, stop) as (pts, frames) views, one pair per chunk touched"""
+        parts = []
+        while start < stop:
+            n, slot = divmod(start, self.chunk_frames)
+            end = min(stop, (n + 1) * self.chunk_frames)
+            parts.append((self.pts[start:end], self._chunk(n)[slot:slot + end - start]))
+            start = end
+        return parts
+
+    def slice_time(self, t0, t1):
+        """Frames with t0 <= pts < t1 (ns) as (pts, frames) views per chunk"""
+        start = int(np.searchsorted(self.pts, t0, side='left'))
+        stop = int(np.searchsorted(self.pts, t1, side='left'))
+        return self.slice(start, stop)
@@ -1,8 +1,25 @@
+import os
+import sys
+import time
+
 import numpy as np
 import cv2 as cv
+from archiver import FrameArchiver
+from framestore import FrameStoreWriter
 cap = cv.VideoCapture('road.mp4')
 pathOut= "/home/dheeraj/dheeraj/trafficApp/frameimg/"
 count = 0
+# --headless: no window and no waitKey sleep, frames are stored at decode rate
+headless = '--headless' in sys.argv[1:]
+# --archive: encoded JPEGs for browsing instead of the raw frame store
+archive = '--archive' in sys.argv[1:]
+if archive:
+    # encode on a thread pool, drop frames rather than stall capture when the disk can't keep up
+    archiver = FrameArchiver(pathOut, fmt='jpg', quality=90, workers=2, drop=True)
+else:
+    # raw frames go into memory-mapped chunks with a pts index, read them back with framestore.FrameStore;
+    # a store is never appended to, so every run gets its own
+    store = FrameStoreWriter(os.path.join(pathOut, time.strftime('store-%Y%m%d-%H%M%S')))
 
 while cap.isOpened():
     ret, frame = cap.read()
@@ -10,12 +27,28 @@ while cap.isOpened():
     if not ret:
         print("Can't receive frame (stream end?). Exiting ...")
         break
-    colorful = cv.cvtColor(frame, cv.COLOR_RGB2RGBA)
-    cv.imshow('AICadium: TrafficApp', colorful)
-    cv.imwrite(pathOut + "/frame%d.jpg" % count, frame)
-    print("image saved%d" % count)
+    if archive:
+        archiver.write(frame)
+    else:
+        store.append(frame, int(cap.get(cv.CAP_PROP_POS_MSEC) * 1e6))
     count += 1
+    if count % 100 == 0:
+        if archive:
+            print("frames %d: %s" % (count, archiver.stats()))
+        else:
+            print("frames stored %d" % count)
+    if headless:
+        continue
+    # imshow takes BGR as is, no second colour conversion for display
+    cv.imshow('AICadium: TrafficApp', frame)
     if cv.waitKey(1) == ord('q'):
         break
 cap.release()
-cv.destroyAllWindows()
\ No newline at end of file
+if archive:
+    archiver.close()
+    print("archived: %s" % archiver.stats())
+else:
+    store.close()
+    print("frames stored %d" % count)
+if not headless:
+    cv.destroyAllWindows()